@@ -0,0 +1,152 @@
+"""
+Vectorized random playouts. Thousands of independent kingdoms are held as stacked arrays (one row per board, one
+column per COORD_MAP cell), every step draws a domino and a uniformly random legal placement for all boards at once,
+and finished kingdoms are scored together with array region labeling. Only kingdoms under the standard rules are
+supported.
+"""
+import numpy as np
+
+from kingDomino import (Board, BitBoard, COORD_MAP, CELL_COORDS, CELL_NEIGHBORS, N_CELLS, PLACEMENTS, TERRAIN_CODES,
+                        MAXWIDTH, STANDARD)
+
+EMPTY_CELL = N_CELLS  # padding column, always empty, used for off-grid neighbors
+CASTLE_CODE = TERRAIN_CODES['castle']
+
+NBR = np.full((N_CELLS, 4), EMPTY_CELL, dtype=np.intp)
+for c in range(N_CELLS):
+    NBR[c, :len(CELL_NEIGHBORS[c])] = CELL_NEIGHBORS[c]
+
+# Flattened PLACEMENTS: side A on cell P_A, side B on cell P_B, and the placement bounding box.
+_rows = [(a,) + p for a in range(N_CELLS) for p in PLACEMENTS[a]]
+P_A = np.array([r[0] for r in _rows], dtype=np.intp)
+P_B = np.array([r[1] for r in _rows], dtype=np.intp)
+P_BOX = np.array([r[6:10] for r in _rows])  # i_min, i_max, j_min, j_max
+del _rows
+
+FULL_KINGDOM = MAXWIDTH * MAXWIDTH  # occupied cells, castle included, once the square is filled
+
+
+def board_arrays(board):
+    """ Terrain codes and crowns of a Board or BitBoard as two length-N_CELLS int8 arrays."""
+    if isinstance(board, BitBoard):
+        return (np.frombuffer(bytes(board.terrain), dtype=np.int8).copy(),
+                np.frombuffer(bytes(board.kings), dtype=np.int8).copy())
+    assert isinstance(board, Board)
+    terrain = np.zeros(N_CELLS, dtype=np.int8)
+    kings = np.zeros(N_CELLS, dtype=np.int8)
+    for coords, side in board.B.items():
+        terrain[COORD_MAP[coords]] = TERRAIN_CODES[side.terrain]
+        kings[COORD_MAP[coords]] = side.kings
+    return terrain, kings
+
+
+def domino_arrays(dominos):
+    """ Side terrain codes and crowns of a list of dominoes, as four int8 arrays (terrain A, kings A, terrain B,
+    kings B)."""
+    return (np.array([TERRAIN_CODES[d[0].terrain] for d in dominos], dtype=np.int8),
+            np.array([d[0].kings for d in dominos], dtype=np.int8),
+            np.array([TERRAIN_CODES[d[1].terrain] for d in dominos], dtype=np.int8),
+            np.array([d[1].kings for d in dominos], dtype=np.int8))
+
+
+class BatchPlayout(object):
+    """ n copies of one starting kingdom, advanced together by random placements."""
+
+    def __init__(self, board, n, rng=None):
+        assert board.rules is STANDARD, 'Batch playouts only run the standard rules, not %r.' % board.rules
+        terrain, kings = board_arrays(board)
+        self.n = n
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # One extra, always empty column stands in for off-grid neighbors.
+        self.terrain = np.zeros((n, N_CELLS + 1), dtype=np.int8)
+        self.kings = np.zeros((n, N_CELLS + 1), dtype=np.int8)
+        self.terrain[:, :N_CELLS] = terrain
+        self.kings[:, :N_CELLS] = kings
+
+        occupied = np.flatnonzero(terrain)
+        ij = np.array([CELL_COORDS[c] for c in occupied])
+        self.bounds = np.empty((n, 4), dtype=np.int64)  # i_min, i_max, j_min, j_max
+        self.bounds[:] = (ij[:, 0].min(), ij[:, 0].max(), ij[:, 1].min(), ij[:, 1].max())
+
+        castle = np.flatnonzero(terrain == CASTLE_CODE)[0]
+        self.castle_adjacent = (np.isin(P_A, CELL_NEIGHBORS[castle]) | np.isin(P_B, CELL_NEIGHBORS[castle]))
+
+    def legal_placements(self, ta, tb):
+        """ (n, n_placements) mask of legal placements for domino side codes ta, tb (one per board)."""
+        terrain = self.terrain
+        empty = (terrain[:, P_A] == 0) & (terrain[:, P_B] == 0)
+        nbr_terrain = terrain[:, NBR]  # (n, N_CELLS, 4)
+        touches = (self.castle_adjacent[None, :] |
+                   (nbr_terrain == ta[:, None, None]).any(axis=2)[:, P_A] |
+                   (nbr_terrain == tb[:, None, None]).any(axis=2)[:, P_B])
+        b = self.bounds
+        fits = ((np.maximum(b[:, 1:2], P_BOX[None, :, 1]) - np.minimum(b[:, 0:1], P_BOX[None, :, 0]) < MAXWIDTH) &
+                (np.maximum(b[:, 3:4], P_BOX[None, :, 3]) - np.minimum(b[:, 2:3], P_BOX[None, :, 2]) < MAXWIDTH))
+        return empty & touches & fits
+
+    def step(self, ta, ka, tb, kb):
+        """ Place one domino per board (side codes/crowns given per board) at a random legal spot. Boards with no
+        legal spot discard it. Returns the mask of boards that placed."""
+        legal = self.legal_placements(ta, tb)
+        placed = legal.any(axis=1)
+        choice = np.argmax(np.where(legal, self.rng.random(legal.shape), -1.0), axis=1)
+        rows = np.flatnonzero(placed)
+        p = choice[rows]
+        self.terrain[rows, P_A[p]] = ta[rows]
+        self.kings[rows, P_A[p]] = ka[rows]
+        self.terrain[rows, P_B[p]] = tb[rows]
+        self.kings[rows, P_B[p]] = kb[rows]
+        box = P_BOX[p]
+        b = self.bounds
+        b[rows, 0] = np.minimum(b[rows, 0], box[:, 0])
+        b[rows, 1] = np.maximum(b[rows, 1], box[:, 1])
+        b[rows, 2] = np.minimum(b[rows, 2], box[:, 2])
+        b[rows, 3] = np.maximum(b[rows, 3], box[:, 3])
+        return placed
+
+    def run(self, dominos, n_steps=None):
+        """ Draw dominoes without replacement from the list dominos, independently per board, and place each at a
+        random legal spot. Stops after n_steps draws (default: the whole list)."""
+        if n_steps is None:
+            n_steps = len(dominos)
+        n_steps = min(n_steps, len(dominos))
+        if n_steps == 0:
+            return
+        ta, ka, tb, kb = domino_arrays(dominos)
+        order = self.rng.permuted(np.tile(np.arange(len(dominos)), (self.n, 1)), axis=1)
+        n_occupied = np.count_nonzero(self.terrain, axis=1)
+        for s in range(n_steps):
+            if (n_occupied >= FULL_KINGDOM).all():
+                break
+            d = order[:, s]
+            n_occupied += 2 * self.step(ta[d], ka[d], tb[d], kb[d])
+
+    def score_kings(self):
+        """ Score of every board, by min-label propagation over same-terrain neighbors."""
+        n = self.n
+        terrain = self.terrain[:, :N_CELLS]
+        scored = (terrain != 0) & (terrain != CASTLE_CODE)
+        unlabeled = N_CELLS
+        labels = np.where(scored, np.arange(N_CELLS)[None, :], unlabeled)
+        labels = np.concatenate([labels, np.full((n, 1), unlabeled)], axis=1)
+        rows = np.arange(n)[:, None]
+        same = terrain[:, :, None] == self.terrain[rows[:, :, None], NBR[None]]  # (n, N_CELLS, 4)
+        same &= scored[:, :, None]
+        while True:
+            nbr_labels = np.where(same, labels[rows[:, :, None], NBR[None]], unlabeled).min(axis=2)
+            new = np.minimum(labels[:, :N_CELLS], nbr_labels)
+            if np.array_equal(new, labels[:, :N_CELLS]):
+                break
+            labels[:, :N_CELLS] = new
+
+        flat = (rows * (N_CELLS + 1) + labels[:, :N_CELLS])[scored]
+        size = np.bincount(flat, minlength=n * (N_CELLS + 1))
+        crowns = np.bincount(flat, weights=self.kings[:, :N_CELLS][scored], minlength=n * (N_CELLS + 1))
+        return (size * crowns).reshape(n, N_CELLS + 1).sum(axis=1).astype(np.int64)
+
+
+def playout_scores(board, dominos, n, n_steps=None, rng=None):
+    """ Scores of n independent random playouts from board, drawing from the collection dominos."""
+    batch = BatchPlayout(board, n, rng=rng)
+    batch.run(list(dominos), n_steps=n_steps)
+    return batch.score_kings()
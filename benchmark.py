@@ -0,0 +1,265 @@
+"""
+Seeded benchmarks for the board hot paths and for search throughput.
+
+    python benchmark.py                                 # print results
+    python benchmark.py --output results.json           # also save them
+    python benchmark.py --baseline results.json         # compare, exit 1 on a regression
+
+Every result is a rate (operations, playouts or nodes per second), so higher is always better. Board operations are
+timed on kingdoms built by the same seeded random game at an early, mid and late stage. In each of --processes fresh
+interpreters a result is the best of --repeat short rounds, interleaved over all benchmarks so that a slow spell costs
+every result a round or two instead of costing a few results all of theirs; the reported rate is the median over the
+interpreters. A result is a regression when it falls more than --threshold (a fraction) below the baseline. Results
+that do are timed again, up to --retries more times, and keep their best rate: a slow spell on a busy machine passes
+on a later try, a slower engine fails every try.
+
+Cold import times of the core modules are measured in fresh interpreters and reported apart from the rates: they
+vary by a third or more between runs, so they are only checked against IMPORT_BUDGET, never against the baseline.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import kingDomino as kD
+from domino_library import DOMINO_LIB
+from branch_and_bound import BranchAndBoundSolver
+from rollout import HeuristicRollout
+
+STAGES = (('early', 2), ('mid', 6), ('late', 10))  # dominoes placed before timing
+BOARDS = (('Board', kD.Board), ('BitBoard', kD.BitBoard))
+FORMAT_VERSION = 4
+IMPORT_BUDGET = 0.15  # seconds for a cold import of each of CORE_MODULES, engine and its dependencies included
+CORE_MODULES = ('kingDomino', 'domino_library', 'worker_pool', 'branch_and_bound', 'game')
+SOLVER_ROUND_COST = 8  # a solver round is a whole search of a second or more, so it gets 1/8 of the rounds
+
+
+def build_stage(board_factory, n_placed, seed):
+    """ (board, next domino, dominoes left) after n_placed seeded random placements. The next domino is one that still
+    fits somewhere."""
+    rng = random.Random(seed)
+    deck = rng.sample(DOMINO_LIB, len(DOMINO_LIB))
+    board = board_factory()
+    placed = 0
+    while placed < n_placed:
+        domino = deck.pop()
+        moves = sorted(board.get_feasible_move_set(domino), key=kD.encode_move)
+        if moves:
+            board.assign_domino(rng.choice(moves))
+            placed += 1
+    while not board.get_feasible_move_set(deck[-1]):
+        deck.pop()
+    return board, deck.pop(), deck
+
+
+def probe_moves(domino):
+    """ Every anchor cell and orientation of domino on the grid, valid or not, as a scan would try them."""
+    return [kD.Move(domino, 0, i, j, Di, Dj) for i, j in kD.CELL_COORDS for Di, Dj in kD.ORIENTATIONS]
+
+
+def rate(fn, items, min_time):
+    """ Calls per second of fn over items, looping over them for at least min_time seconds."""
+    assert items, 'Nothing to time.'
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for item in items:
+            fn(item)
+        calls += len(items)
+        elapsed = time.perf_counter() - start
+    return calls / elapsed
+
+
+def timer(fn, items, min_time):
+    """ A round of rate(fn, items, min_time), to be called once per round."""
+    return lambda: rate(fn, items, min_time)
+
+
+def board_benchmarks(seed, min_time):
+    """ {name: timer} for the board operations at each stage."""
+    timers = {}
+    for board_name, board_factory in BOARDS:
+        for stage, n_placed in STAGES:
+            board, domino, deck = build_stage(board_factory, n_placed, seed)
+            moves = sorted(board.get_feasible_move_set(domino), key=kD.encode_move)
+            probes = probe_moves(domino)
+            dominos = deck[:8]
+
+            def push_pop(mv, board=board):
+                board.push(mv)
+                board.pop()
+
+            prefix = '%s.%s.' % (board_name, stage)
+            timers[prefix + 'push_pop'] = timer(push_pop, moves, min_time)
+            timers[prefix + 'check_move_validity'] = timer(board.check_move_validity, probes, min_time)
+            timers[prefix + 'get_feasible_move_set'] = timer(board.get_feasible_move_set, dominos, min_time)
+            timers[prefix + 'feasible_codes'] = timer(board.feasible_codes, dominos, min_time)
+            timers[prefix + 'score_kings'] = timer(lambda _, board=board: board.score_kings(), range(100), min_time)
+            timers[prefix + 'score_deltas'] = timer(board.score_deltas, dominos, min_time)
+            timers[prefix + 'deepcopy'] = timer(copy.deepcopy, [board], min_time)
+    return timers
+
+
+def playout_benchmark(seed, min_time):
+    """ {name: timer} for playouts per second of MonteCarloKingDominoThinker.single_playout from the early-stage
+    kingdom, with random and with heuristic rollouts. Each round replays the same seeded playouts."""
+    board, domino, deck = build_stage(kD.Board, STAGES[0][1], seed)
+    timers = {}
+    for name, policy in (('playouts', None), ('heuristic_playouts', HeuristicRollout())):
+        thinker = kD.MonteCarloKingDominoThinker(board, deck, rollout_policy=policy)
+
+        def playouts(thinker=thinker):
+            random.seed(seed)
+            return rate(thinker.single_playout, [board] * 10, min_time)
+
+        timers['MonteCarloKingDominoThinker.' + name] = playouts
+    return timers
+
+
+def solver_benchmark(seed, n_dominos=12, node_limit=5000):
+    """ {name: timer} for nodes per second of the branch-and-bound search over the first n_dominos of a seeded
+    deck."""
+    dominos = random.Random(seed).sample(DOMINO_LIB, n_dominos)
+
+    def nodes():
+        result = BranchAndBoundSolver(kD.Board(), dominos, node_limit=node_limit).solve()
+        return result.nodes / result.elapsed
+
+    return {'BranchAndBoundSolver.nodes': nodes}
+
+
+def measure(timers, repeat):
+    """ {name: best rate of repeat rounds}, the rounds taken in turn over all timers."""
+    best = dict.fromkeys(timers, 0.0)
+    for _ in range(repeat):
+        for name, time_round in timers.items():
+            best[name] = max(best[name], time_round())
+    return best
+
+
+def import_times(repeat=5):
+    """ {module: seconds} for a cold import of each of CORE_MODULES in a fresh interpreter, best of repeat."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    for module in CORE_MODULES:
+        code = 'import time; t = time.perf_counter(); import %s; print(time.perf_counter() - t)' % module
+        times[module] = min(float(subprocess.check_output([sys.executable, '-c', code], cwd=here))
+                            for _ in range(repeat))
+    return times
+
+
+def measure_here(seed, min_time, repeat, names=None):
+    """ {name: best rate} for names (all results by default), timed in this interpreter."""
+    timers = board_benchmarks(seed, min_time)
+    timers.update(playout_benchmark(seed, min_time))
+    solver_timers = solver_benchmark(seed)
+    if names is not None:
+        timers = dict((name, t) for name, t in timers.items() if name in names)
+        solver_timers = dict((name, t) for name, t in solver_timers.items() if name in names)
+    results = measure(timers, repeat)
+    results.update(measure(solver_timers, max(1, repeat // SOLVER_ROUND_COST)))
+    return results
+
+
+def measure_processes(seed, min_time, repeat, processes, names=None):
+    """ {name: median over processes of measure_here in a fresh interpreter}. Rates depend on the interpreter as well
+    as the code: the same result can sit a quarter apart in two processes while holding steady within each."""
+    here = os.path.abspath(__file__)
+    command = [sys.executable, here, '--worker', '--seed', str(seed), '--min-time', repr(min_time),
+               '--repeat', str(repeat)]
+    if names is not None:
+        command += ['--only'] + sorted(names)
+    runs = [json.loads(subprocess.check_output(command, cwd=os.path.dirname(here))) for _ in range(processes)]
+    return dict((name, statistics.median(run[name] for run in runs)) for name in runs[0])
+
+
+def run(seed, min_time, repeat, processes):
+    imports = import_times()
+    return {'version': FORMAT_VERSION, 'seed': seed, 'python': platform.python_version(),
+            'results': measure_processes(seed, min_time, repeat, processes), 'imports': imports}
+
+
+def slow_results(report, baseline, threshold):
+    """ Names of results more than threshold below the baseline."""
+    return [name for name, value in sorted(report['results'].items())
+            if name in baseline['results'] and value < (1 - threshold) * baseline['results'][name]]
+
+
+def compare(report, baseline, threshold):
+    """ Print each result against the baseline; returns the names of results that regressed."""
+    regressions = []
+    for name, value in sorted(report['results'].items()):
+        old = baseline['results'].get(name)
+        if old is None:
+            print('%-50s %14.1f/s  (new)' % (name, value))
+            continue
+        change = value / old - 1
+        flag = ''
+        if change < -threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print('%-50s %14.1f/s  %+7.1f%%%s' % (name, value, 100 * change, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='KingDomino engine benchmarks.')
+    parser.add_argument('--seed', type=int, default=20180131)
+    parser.add_argument('--min-time', type=float, default=0.01, help='seconds per timing round')
+    parser.add_argument('--repeat', type=int, default=20, help='timing rounds per result in each process')
+    parser.add_argument('--processes', type=int, default=3, help='interpreters to time in; results are their median')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare against this JSON file')
+    parser.add_argument('--threshold', type=float, default=0.12, help='allowed slowdown as a fraction')
+    parser.add_argument('--retries', type=int, default=2, help='times to time regressed results again')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--only', nargs='*', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        json.dump(measure_here(args.seed, args.min_time, args.repeat, args.only), sys.stdout)
+        return 0
+
+    report = run(args.seed, args.min_time, args.repeat, args.processes)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        assert baseline.get('version') == FORMAT_VERSION, 'Baseline was written by another benchmark version.'
+        for _ in range(args.retries):
+            slow = slow_results(report, baseline, args.threshold)
+            if not slow:
+                break
+            for name, value in measure_processes(args.seed, args.min_time, args.repeat, args.processes, slow).items():
+                report['results'][name] = max(report['results'][name], value)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    status = 0
+    for module, seconds in sorted(report['imports'].items()):
+        over = seconds > IMPORT_BUDGET
+        print('%-50s %14.3fs%s' % ('import ' + module, seconds, '  OVER %.3fs BUDGET' % IMPORT_BUDGET if over else ''))
+        if over:
+            status = 1
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print('%d regression(s) beyond %.0f%%' % (len(regressions), 100 * args.threshold))
+            status = 1
+    else:
+        for name, value in sorted(report['results'].items()):
+            print('%-50s %14.1f/s' % (name, value))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
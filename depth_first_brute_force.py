@@ -1,36 +1,17 @@
+import sys
+
 import kingDomino as kD
-import copy
 from domino_library import DOMINO_LIB
-
-MAX_SCORE = 0
-
-
-def sera(Dominos, board, visited=None):
-    global MAX_SCORE
-
-    if visited is None:
-        visited = set()
-
-    for d in Dominos - visited:
-        M = board.get_feasible_move_set(d)
-        if len(M) != 0:
-            visited.add(d)
-            for mv in M:
-                bc = copy.deepcopy(board)
-                bc.assign_domino(mv)
-                sera(Dominos, bc, visited)
-            visited.remove(d)
-    score = board.score_kings()
-
-    if score > MAX_SCORE:
-        MAX_SCORE = score
-        print(score, board.B)
-    return
-
-
-myBoard = kD.Board()
-myBoard.max_score = 0
-
-sera(set(DOMINO_LIB), myBoard)
-
-# Next, try implement a greedy algorithm. It will choose the highest value-add among all moves.
\ No newline at end of file
+from branch_and_bound import solve
+
+if __name__ == '__main__':
+    # Best kingdom buildable from the whole library (or its first n dominoes), with an optional time limit in seconds.
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else len(DOMINO_LIB)
+    time_limit = float(sys.argv[2]) if len(sys.argv) > 2 else None
+
+    myBoard = kD.Board()
+    result = solve(myBoard, DOMINO_LIB[:n], time_limit=time_limit)
+    print(result)
+    for mv in result.moves:
+        print(mv)
+    result.board.show()
@@ -0,0 +1,167 @@
+"""
+Exact endgame values: the expected final score of a kingdom when the dominoes left are drawn in uniformly random
+order and each is placed as well as possible, or discarded if it fits nowhere, until the deck runs out or the kingdom
+is full. This is the game random_playout samples, solved by expectimax instead of estimated:
+
+    value(board, deck) = final score                                  if deck is empty or the kingdom is full
+                       = mean over d in deck of max over placements p of value(board + p, deck - d)
+                                                 (value(board, deck - d) if d fits nowhere)
+
+Values are memoized by the kingdom's canonical hash and the deck up to interchangeable dominoes (see deck_key), so
+symmetric kingdoms and dominoes with the same two sides are solved once. Final scores include the bonus points of
+the solver's rules (see kingDomino.Rules), so a table holds values for one set of rules. It can be saved and loaded
+again by later games under the same rules:
+
+    header: MAGIC, then the record count as uint32
+    record: canonical hash, deck key (uint64 each), expected score (float32), sorted by key
+"""
+import os
+import struct
+import time
+
+from domino_library import DOMINO_LIB
+from branch_and_bound import domino_kind
+from kingDomino import STANDARD
+
+MAGIC = b'KDEND1\0\0'
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<QQf')
+
+# Library numbers per domino kind, lowest first. deck_key writes n dominoes of a kind as the first n of them.
+KIND_NUMBERS = {}
+for _d in sorted(DOMINO_LIB, key=lambda d: d.number):
+    KIND_NUMBERS.setdefault(domino_kind(_d), []).append(_d.number)
+
+
+def deck_key(dominos):
+    """ Bitmask of domino numbers equal for any two decks that differ only in which copies of a kind they hold."""
+    counts = {}
+    mask = 0
+    for d in dominos:
+        kind = domino_kind(d)
+        numbers = KIND_NUMBERS.get(kind, ())
+        n = counts.get(kind, 0)
+        counts[kind] = n + 1
+        mask |= 1 << (numbers[n] if n < len(numbers) else d.number)
+    return mask
+
+
+class EndgameSolver(object):
+    """ Expectimax over the last max_remaining dominoes of kingdoms played under rules. Give a path to load a saved
+    table from it, if the file exists, and to save() to it."""
+
+    def __init__(self, max_remaining=4, path=None, rules=STANDARD):
+        self.max_remaining = max_remaining  # MonteCarloKingDominoThinker solves exactly from this many dominoes left
+        self.path = path
+        self.rules = rules
+        self.table = {}  # (canonical hash, deck key) -> expected final score
+        self.loaded = 0
+        self.nodes = 0  # positions solved, not counting table hits
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.table)
+
+    def applies(self, remaining_dominos):
+        return len(remaining_dominos) <= self.max_remaining
+
+    def value(self, board, dominos):
+        """ Expected final score of board with dominos (a collection of Domino) still to be drawn. The board is
+        searched in place with push/pop and left as it was found."""
+        if not dominos or board.is_full():
+            return float(board.final_score())
+        dominos = tuple(dominos)
+        key = (board.canonical_hash(), deck_key(dominos))
+        value = self.table.get(key)
+        if value is not None:
+            return value
+        self.nodes += 1
+
+        place = board.rules.placement_move
+        kinds = {}  # domino kind -> dominoes of that kind in the deck
+        for d in dominos:
+            kinds.setdefault(domino_kind(d), []).append(d)
+        total = 0.0
+        for same in kinds.values():
+            d = same[0]
+            rest = tuple(o for o in dominos if o.number != d.number)
+            best = None
+            for code in board.feasible_codes(d):
+                board.push(place(d, code))
+                try:
+                    v = self.value(board, rest)
+                finally:
+                    board.pop()
+                if best is None or v > best:
+                    best = v
+            if best is None:
+                best = self.value(board, rest)
+            total += len(same) * best
+        value = total / len(dominos)
+        self.table[key] = value
+        return value
+
+    def move_values(self, board, moves, remaining_dominos):
+        """ {move: expected final score after move}, the domino of each move being taken out of remaining_dominos."""
+        assert board.rules is self.rules, 'This endgame table is for %r, not %r.' % (self.rules, board.rules)
+        values = {}
+        for mv in moves:
+            rest = tuple(d for d in remaining_dominos if d.number != mv.domino.number)
+            with board.placed(mv):
+                values[mv] = self.value(board, rest)
+        return values
+
+    def load(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, n_records = HEADER.unpack_from(data, 0)
+        assert magic == MAGIC, 'Not an endgame table: %s' % path
+        assert len(data) == HEADER.size + n_records * RECORD.size, 'Truncated endgame table: %s' % path
+        for h, deck, value in RECORD.iter_unpack(memoryview(data)[HEADER.size:]):
+            self.table[h, deck] = value
+        self.loaded = n_records
+
+    def save(self, path=None):
+        """ Write the whole table to path (by default the one it was loaded from) and return the record count. The
+        file is replaced atomically, so readers never see a partial table."""
+        path = path or self.path
+        assert path is not None, 'No path to save the endgame table to.'
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(self.table)))
+            for key in sorted(self.table):
+                f.write(RECORD.pack(key[0], key[1], self.table[key]))
+        os.replace(tmp, path)
+        return len(self.table)
+
+
+if __name__ == '__main__':
+    import argparse
+    import random
+    from kingDomino import Board, placement_move
+
+    parser = argparse.ArgumentParser(description='Solve random late-game positions into an endgame table.')
+    parser.add_argument('path')
+    parser.add_argument('--games', type=int, default=10)
+    parser.add_argument('--remaining', type=int, default=4, help='dominoes left in the deck when solving')
+    parser.add_argument('--placed', type=int, default=9, help='dominoes placed at random before solving')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    solver = EndgameSolver(args.remaining, args.path)
+    rng = random.Random(args.seed)
+    start = time.time()
+    for game in range(args.games):
+        deck = rng.sample(DOMINO_LIB, len(DOMINO_LIB))
+        board = Board()
+        placed = 0
+        while placed < args.placed and len(deck) > args.remaining:
+            d = deck.pop()
+            codes = board.feasible_codes(d)
+            if codes:
+                board.assign_domino(placement_move(d, rng.choice(codes)))
+                placed += 1
+        print('game %d: %.2f expected (%d nodes, %.1fs)' % (game, solver.value(board, deck[:args.remaining]),
+                                                            solver.nodes, time.time() - start))
+    print('%d records written' % solver.save())
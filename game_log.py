@@ -0,0 +1,207 @@
+"""
+Compact binary logs of games and kingdoms, written append-only and read back through a memory map.
+
+    with GameLogWriter('selfplay.kdlog') as log:
+        for seed in range(1000):
+            game = Game(4, seed=seed)
+            game.play()
+            log.write_game(game)
+    with GameLogReader('selfplay.kdlog') as log:
+        for record in log:
+            boards = record.replay()
+
+Layout (little-endian):
+
+    file header:   MAGIC, format VERSION (uint16)
+    record:        payload length (uint32), record type (uint8), payload
+    GAME payload:  player count (uint8), final score per player (int16), then one event per placement in play order:
+                   player (uint8) and move code (uint16, see kingDomino.encode_move), or DISCARD | domino number
+    BOARD payload: (cell, cell byte) pairs for every occupied cell but the castle (see Board.encode)
+
+Move codes carry DOMINO_LIB numbers, so a placement costs 3 bytes in a game and a kingdom about 4 bytes per domino.
+Every record is written with a single write() and the reader stops at a truncated last record, so a log being
+appended to, or cut short by a crash, can still be read. Records are decoded lazily from memoryview slices of the
+map: iterating a log touches only the record headers.
+"""
+import mmap
+import os
+import struct
+
+from domino_library import DOMINO_LIB
+from game import DISCARD
+from kingDomino import BitBoard, COORD_MAP, N_SLOTS, decode_board, encode_move, placement_move
+
+MAGIC = b'KDLOG\0\0\0'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sH')
+RECORD_HEADER = struct.Struct('<IB')
+EVENT = struct.Struct('<BH')
+CELL = struct.Struct('<BB')
+GAME = 1
+BOARD = 2
+DOMINOS_BY_NUMBER = {d.number: d for d in DOMINO_LIB}
+CASTLE_CELL = COORD_MAP[0, 0]
+
+
+def encode_game(scores, history):
+    """ GAME payload for final scores (one per player) and a history of (player, move code or DISCARD | number)."""
+    payload = bytearray(struct.pack('<B%dh' % len(scores), len(scores), *scores))
+    for player, code in history:
+        payload += EVENT.pack(player, code)
+    return bytes(payload)
+
+
+def encode_board(board):
+    """ BOARD payload for a Board or BitBoard."""
+    return b''.join(CELL.pack(c, code) for c, code in enumerate(board.encode()) if code and c != CASTLE_CELL)
+
+
+class GameRecord(object):
+    """ A logged game. events is a memoryview into the log; nothing is decoded until asked for."""
+
+    def __init__(self, payload):
+        self.n_players = payload[0]
+        self.scores = struct.unpack_from('<%dh' % self.n_players, payload, 1)
+        self.events = payload[1 + 2 * self.n_players:]
+
+    def __len__(self):
+        return len(self.events) // EVENT.size
+
+    def __repr__(self):
+        return 'game: %d players, %d placements, scores %s' % (self.n_players, len(self), list(self.scores))
+
+    def moves(self):
+        """ (player, Move) per event in play order; the Move is None for a discard."""
+        for player, code in EVENT.iter_unpack(self.events):
+            if code & DISCARD:
+                yield player, None
+            else:
+                yield player, placement_move(DOMINOS_BY_NUMBER[(code >> 1) // N_SLOTS], code)
+
+    def replay(self, board_factory=BitBoard):
+        """ Final kingdom of every player, rebuilt by placing the logged moves."""
+        boards = [board_factory() for p in range(self.n_players)]
+        for player, mv in self.moves():
+            if mv is not None:
+                assert boards[player].assign_domino(mv), 'Logged move is not valid: %r' % mv
+        return boards
+
+
+class BoardRecord(object):
+
+    def __init__(self, payload):
+        self.cells = payload
+
+    def __repr__(self):
+        return 'board: %d cells' % (len(self.cells) // CELL.size)
+
+    def board(self):
+        """ The kingdom as a BitBoard."""
+        cells = bytearray(len(COORD_MAP))
+        for c, code in CELL.iter_unpack(self.cells):
+            cells[c] = code
+        return decode_board(cells)
+
+
+RECORD_TYPES = {GAME: GameRecord, BOARD: BoardRecord}
+
+
+def complete_length(data):
+    """ Bytes of data up to the end of its last complete record."""
+    end = len(data)
+    offset = FILE_HEADER.size
+    while offset + RECORD_HEADER.size <= end:
+        length = RECORD_HEADER.unpack_from(data, offset)[0]
+        if offset + RECORD_HEADER.size + length > end:
+            break
+        offset += RECORD_HEADER.size + length
+    return offset
+
+
+class GameLogWriter(object):
+    """ Appends records to a log, creating it if needed. A truncated last record, left by a writer that crashed, is
+    cut off first. Use as a context manager or call close()."""
+
+    def __init__(self, path, flush_every=1):
+        self.f = open(path, 'ab')
+        self.flush_every = flush_every  # records between flushes
+        self.n_written = 0
+        if self.f.tell() == 0:
+            self.f.write(FILE_HEADER.pack(MAGIC, VERSION))
+            self.f.flush()
+        else:
+            with GameLogReader(path) as log:
+                end = complete_length(log.data)
+            if end < self.f.tell():
+                self.f.truncate(end)
+
+    def write(self, record_type, payload):
+        self.f.write(RECORD_HEADER.pack(len(payload), record_type) + payload)
+        self.n_written += 1
+        if self.n_written % self.flush_every == 0:
+            self.f.flush()
+
+    def write_game(self, game):
+        """ Log a finished game.Game. Move codes are logged as they are, so the game must be on the standard grid
+        (bonus rules are fine: the logged scores include their points)."""
+        assert game.discard == DISCARD, 'Only games on the standard grid fit the log format, not %r.' % game.rules
+        self.write(GAME, encode_game(game.scores(), game.history))
+
+    def write_moves(self, moves, score):
+        """ Log a solitaire game: moves placed in order on a castle-only kingdom, and its final score."""
+        self.write(GAME, encode_game([score], [(0, encode_move(mv)) for mv in moves]))
+
+    def write_board(self, board):
+        self.write(BOARD, encode_board(board))
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GameLogReader(object):
+    """ Memory-mapped, read-only view of a log; iterating yields GameRecord and BoardRecord objects. Use as a context
+    manager or call close() once the records are no longer needed."""
+
+    def __init__(self, path):
+        assert os.path.getsize(path) >= FILE_HEADER.size, 'Not a game log: %s' % path
+        self.f = open(path, 'rb')
+        self.data = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.data)
+        magic, version = FILE_HEADER.unpack_from(self.data, 0)
+        assert magic == MAGIC, 'Not a game log: %s' % path
+        assert version == VERSION, 'Game log %s has format version %d, not %d.' % (path, version, VERSION)
+
+    def __iter__(self):
+        view = self.view
+        end = len(view)
+        offset = FILE_HEADER.size
+        while offset + RECORD_HEADER.size <= end:
+            length, record_type = RECORD_HEADER.unpack_from(view, offset)
+            start = offset + RECORD_HEADER.size
+            if start + length > end:
+                break  # still being written, or cut short; see complete_length
+            yield RECORD_TYPES[record_type](view[start:start + length])
+            offset = start + length
+
+    def games(self):
+        return (record for record in self if isinstance(record, GameRecord))
+
+    def close(self):
+        self.view.release()
+        try:
+            self.data.close()
+        except BufferError:
+            pass  # records still refer to the map; it is unmapped once they are gone
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,156 @@
+"""
+Opt-in instrumentation for the board hot paths and for MonteCarloKingDominoThinker searches.
+
+    with instrumentation.enabled(stream=open('trace.jsonl', 'w')) as stats:
+        thinker.think_about_set_of_moves(feasible_set)
+    print(stats.counters['Board.get_feasible_move_set'], stats.turns[-1].to_dict())
+
+Nothing is wrapped while instrumentation is off; the thinker only tests ACTIVE once per turn. enable() swaps timing
+wrappers into Board and BitBoard, and disable() puts the original methods back. Timings are inclusive: push() time
+includes the assign_domino() and check_move_validity() calls it makes. Counters cover the calling process only;
+playout workers report through the per-turn TurnStats.
+
+With a stream, every turn and, on disable(), the counters are written to it as JSON lines.
+"""
+from contextlib import contextmanager
+from functools import wraps
+import json
+import time
+
+HOT_PATHS = ('assign_domino', 'check_move_validity', 'get_feasible_move_set', 'feasible_codes', 'score_kings',
+             'score_delta', 'score_deltas', 'placement_gain', 'push', 'pop')
+
+ACTIVE = None  # the enabled Instrumentation, if any
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __repr__(self):
+        return '%d calls, %.3fs' % (self.calls, self.seconds)
+
+    def to_dict(self):
+        return {'calls': self.calls, 'seconds': self.seconds}
+
+
+class TurnStats(object):
+    """ One think_about_set_of_moves: per evaluated position (keyed by its representative move code) the playouts,
+    mean score and variance of that mean; playouts per second for each worker; and the delay before the first
+    worker picked up a task."""
+
+    def __init__(self, n_moves, n_positions, think_time, wall_time, dispatch_latency, moves, workers):
+        self.n_moves = n_moves
+        self.n_positions = n_positions
+        self.think_time = think_time
+        self.wall_time = wall_time
+        self.dispatch_latency = dispatch_latency
+        self.moves = moves  # move code -> {'playouts': k, 'mean': score, 'variance': variance of the mean or None}
+        self.workers = workers  # worker pid -> playouts per second
+
+    def __repr__(self):
+        return '%d moves, %d positions, %d playouts in %.2fs' % (
+            self.n_moves, self.n_positions, sum(m['playouts'] for m in self.moves.values()), self.wall_time)
+
+    def to_dict(self):
+        return {'n_moves': self.n_moves, 'n_positions': self.n_positions, 'think_time': self.think_time,
+                'wall_time': self.wall_time, 'dispatch_latency': self.dispatch_latency, 'moves': self.moves,
+                'workers': self.workers}
+
+
+def search_turn(n_moves, think_time, started, dispatched, results):
+    """ TurnStats from the worker results of a turn's PlayoutPool.evaluate calls (see worker_pool.evaluate_move).
+    A position may have been played out by several tasks, e.g. over successive halving rounds; its tasks are summed
+    before the mean and variance are taken."""
+    sums = {}  # move code -> [score sum, sum of squared scores, playouts]
+    worker_playouts = {}
+    worker_seconds = {}
+    first_start = None
+    for code, total, total_sq, k, pid, start, seconds in results:
+        s = sums.setdefault(code, [0, 0, 0])
+        s[0] += total
+        s[1] += total_sq
+        s[2] += k
+        worker_playouts[pid] = worker_playouts.get(pid, 0) + k
+        worker_seconds[pid] = worker_seconds.get(pid, 0.0) + seconds
+        first_start = start if first_start is None else min(first_start, start)
+    moves = {}
+    for code, (total, total_sq, k) in sums.items():
+        mean = float(total) / k
+        variance = None
+        if k > 1:
+            variance = max(0.0, (total_sq - k * mean * mean) / (k - 1)) / k
+        moves[code] = {'playouts': k, 'mean': mean, 'variance': variance}
+    workers = {pid: worker_playouts[pid] / max(worker_seconds[pid], 1e-9) for pid in worker_playouts}
+    latency = None if first_start is None else max(0.0, first_start - dispatched)
+    return TurnStats(n_moves, len(moves), think_time, time.time() - started, latency, moves, workers)
+
+
+class Instrumentation(object):
+
+    def __init__(self, stream=None, hot_paths=HOT_PATHS):
+        self.stream = stream  # file-like object for JSON lines, or None
+        self.hot_paths = hot_paths
+        self.counters = {}  # 'Class.method' -> Counter
+        self.turns = []  # TurnStats, in order
+        self._originals = []
+
+    def enable(self):
+        global ACTIVE
+        assert ACTIVE is None, 'Instrumentation is already enabled.'
+        from kingDomino import Board, BitBoard
+        for cls in (Board, BitBoard):
+            for name in self.hot_paths:
+                if name in cls.__dict__:
+                    self._wrap(cls, name)
+        ACTIVE = self
+        return self
+
+    def disable(self):
+        global ACTIVE
+        for cls, name, fn in reversed(self._originals):
+            setattr(cls, name, fn)
+        self._originals = []
+        if ACTIVE is self:
+            ACTIVE = None
+        self.emit({'type': 'counters', 'counters': {k: c.to_dict() for k, c in sorted(self.counters.items())}})
+
+    def _wrap(self, cls, name):
+        fn = cls.__dict__[name]
+        counter = self.counters.setdefault('%s.%s' % (cls.__name__, name), Counter())
+        clock = time.perf_counter
+
+        @wraps(fn)
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                counter.calls += 1
+                counter.seconds += clock() - start
+
+        self._originals.append((cls, name, fn))
+        setattr(cls, name, timed)
+
+    def record_turn(self, turn):
+        self.turns.append(turn)
+        record = turn.to_dict()
+        record['type'] = 'turn'
+        self.emit(record)
+
+    def emit(self, record):
+        if self.stream is not None:
+            self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+            self.stream.flush()
+
+
+@contextmanager
+def enabled(stream=None, hot_paths=HOT_PATHS):
+    """ Context manager enabling an Instrumentation for the duration of the block; yields it."""
+    stats = Instrumentation(stream, hot_paths).enable()
+    try:
+        yield stats
+    finally:
+        stats.disable()
@@ -0,0 +1,238 @@
+"""
+Information-set Monte Carlo tree search for game.Game.
+
+A player does not know the order of the dominoes left in the box, nor (with 2 or 3 players) which of the unseen
+dominoes are in it at all. ISMCTSPolicy samples determinizations: deals of the unseen dominoes consistent with
+everything the player has seen (see Deal.from_game). Every iteration plays one sampled deal down a single shared tree
+(single-observer ISMCTS): edges are (player, action), opponents' picks and placements are chosen in the tree from
+their own point of view, and an action is scored by UCB against the number of visits in which it was available, since
+later menus, and so the legal picks, differ between deals.
+
+The leaf reached is evaluated in a batch: the hidden rest of the box is dealt again `determinizations` times and each
+deal is played out to the end of the game, so one tree walk and one copy of the kingdoms serve many deals. Actions
+are move codes for placements and -(domino number) for picks. A player's reward is their final score minus the best
+opponent score.
+
+Within a fixed think_time the knob trades breadth against depth: each iteration costs about `determinizations`
+playouts, so more determinizations average the hidden deals better at each leaf but leave fewer iterations to grow
+the tree. max_depth caps how many decisions below the root the tree may grow.
+"""
+import copy
+import math
+import random
+import time
+
+from domino_library import DOMINO_LIB
+
+
+class Deal(object):
+    """ One determinization of a Game in progress: its kingdoms, menus and claims, a sampled box and the cursor
+    (see Game.cursor). step() plays actions under the rules of Game.play; placements of dominoes that fit nowhere are
+    discarded without a decision."""
+
+    def __init__(self, boards, old_menu, old_claims, new_menu, new_claims, box, cursor, setup_order, kings_per_player,
+                 n_dominoes_on_menu):
+        self.boards = boards
+        self.old_menu = old_menu
+        self.old_claims = old_claims
+        self.new_menu = new_menu
+        self.new_claims = new_claims
+        self.box = box  # the order dominoes will come out, first first
+        self.cursor = cursor  # None once the game is over
+        self.setup_order = setup_order
+        self.kings_per_player = kings_per_player
+        self.n_dominoes_on_menu = n_dominoes_on_menu
+
+    @staticmethod
+    def from_game(game, rng):
+        """ Deal sampled from what every player can see of game: the box is len(game.dominoes_in_box) dominoes drawn
+        at random from those not yet on a kingdom, discarded or on a menu."""
+        seen = {d.number for d in game.old_menu} | {d.number for d in game.new_menu}
+        for player, code in game.history:
+            seen.add(code & ~game.discard if code & game.discard else (code >> 1) // game.rules.n_slots)
+        unseen = [d for d in DOMINO_LIB if d.number not in seen]
+        return Deal([copy.deepcopy(b) for b in game.boards], list(game.old_menu), list(game.old_claims),
+                    list(game.new_menu), list(game.new_claims), rng.sample(unseen, len(game.dominoes_in_box)),
+                    game.cursor, list(game.setup_order), game.kings_per_player, game.n_dominoes_on_menu)
+
+    def copy(self):
+        return Deal([copy.deepcopy(b) for b in self.boards], list(self.old_menu), list(self.old_claims),
+                    list(self.new_menu), list(self.new_claims), list(self.box), self.cursor, self.setup_order,
+                    self.kings_per_player, self.n_dominoes_on_menu)
+
+    def decision(self):
+        """ (player, legal actions) at the cursor, skipping and applying forced discards; None once the game is
+        over."""
+        while self.cursor is not None:
+            stage, i = self.cursor
+            if stage == 'place':
+                domino = self.old_menu[i]
+                codes = self.boards[self.old_claims[i] // self.kings_per_player].feasible_codes(domino)
+                if not codes:
+                    self._advance()
+                    continue
+                return self.old_claims[i] // self.kings_per_player, codes
+            king = self.setup_order[i] if stage == 'setup' else self.old_claims[i]
+            picks = [-d.number for d, claim in zip(self.new_menu, self.new_claims) if claim is None]
+            return king // self.kings_per_player, picks
+        return None
+
+    def step(self, action):
+        """ Play a legal action at the cursor, as returned by decision()."""
+        stage, i = self.cursor
+        if stage == 'place':
+            domino = self.old_menu[i]
+            board = self.boards[self.old_claims[i] // self.kings_per_player]
+            assert board.push(board.rules.placement_move(domino, action)), 'Illegal placement.'
+        else:
+            king = self.setup_order[i] if stage == 'setup' else self.old_claims[i]
+            n = [d.number for d in self.new_menu].index(-action)
+            assert self.new_claims[n] is None, 'That domino is already claimed.'
+            self.new_claims[n] = king
+        self._advance()
+
+    def _advance(self):
+        stage, i = self.cursor
+        if stage == 'place' and self.new_menu:
+            self.cursor = ('select', i)
+        elif stage == 'setup' and i + 1 < len(self.setup_order):
+            self.cursor = ('setup', i + 1)
+        elif stage != 'setup' and i + 1 < len(self.old_menu):
+            self.cursor = ('place', i + 1)
+        elif self.new_menu:
+            self.old_menu, self.old_claims = self.new_menu, self.new_claims
+            self.new_menu = sorted(self.box[:self.n_dominoes_on_menu])
+            self.box = self.box[self.n_dominoes_on_menu:]
+            self.new_claims = [None] * len(self.new_menu)
+            self.cursor = ('place', 0)
+        else:
+            self.cursor = None
+
+    def rewards(self):
+        """ Per player: final score minus the best opponent score."""
+        scores = [board.final_score() for board in self.boards]
+        return [s - max(scores[:p] + scores[p + 1:]) for p, s in enumerate(scores)]
+
+    def playout(self, rng, rollout_policy=None):
+        """ Play to the end with random picks and random (or rollout_policy) placements; returns rewards(). The
+        kingdoms are restored before returning."""
+        pushed = []
+        try:
+            decision = self.decision()
+            while decision is not None:
+                player, actions = decision
+                if self.cursor[0] == 'place':
+                    if rollout_policy is None:
+                        action = rng.choice(actions)
+                    else:
+                        action = rollout_policy.choose(self.boards[player], self.old_menu[self.cursor[1]], actions)
+                    pushed.append(self.boards[player])
+                else:
+                    action = rng.choice(actions)
+                self.step(action)
+                decision = self.decision()
+            return self.rewards()
+        finally:
+            for board in reversed(pushed):
+                board.pop()
+
+
+class InfoNode(object):
+
+    def __init__(self):
+        self.children = {}  # (player, action) -> InfoNode
+        self.N = {}  # (player, action) -> visits
+        self.W = {}  # (player, action) -> total reward of the acting player
+        self.available = {}  # (player, action) -> visits in which the action was legal
+
+
+class ISMCTSPolicy(object):
+    """ game.Game policy choosing picks and placements by information-set MCTS. See the module docstring for
+    think_time, determinizations and max_depth."""
+
+    def __init__(self, think_time=1.0, determinizations=8, max_depth=8, exploration=0.7, rollout_policy=None,
+                 rng=None):
+        assert determinizations >= 1, 'Need at least one determinization per leaf.'
+        self.think_time = think_time  # seconds per decision
+        self.determinizations = determinizations  # deals played out per leaf
+        self.max_depth = max_depth  # decisions below the root the tree may grow
+        self.exploration = exploration
+        self.rollout_policy = rollout_policy  # see rollout.py; None places uniformly at random in playouts
+        self.rng = rng if rng is not None else random.Random()
+        self.score_scale = 1.0  # largest reward magnitude seen, scales the exploration term
+        self.root = None
+        self.iterations = 0
+        self.playouts = 0
+
+    def choose_domino(self, game, player, options):
+        number = -self.search(game, player)
+        return [d.number for d in game.new_menu].index(number)
+
+    def choose_move(self, game, player, domino, feasible_codes):
+        if len(feasible_codes) == 1:
+            return feasible_codes[0]
+        return self.search(game, player)
+
+    def search(self, game, player):
+        """ Most visited action for player at game.cursor after think_time seconds of search."""
+        self.root = InfoNode()
+        self.iterations = 0
+        self.playouts = 0
+        started = time.time()
+        while self.iterations == 0 or time.time() - started < self.think_time:
+            self._iterate(Deal.from_game(game, self.rng))
+            self.iterations += 1
+        legal = Deal.from_game(game, self.rng).decision()[1]
+        return max(legal, key=lambda a: (self.root.N.get((player, a), 0), self.root.W.get((player, a), 0)))
+
+    def _iterate(self, deal):
+        """ Walk the tree with deal, expand one node, evaluate the leaf over a batch of deals and back up."""
+        node = self.root
+        path = []  # (node, edge)
+        pushed = []
+        try:
+            for depth in range(self.max_depth + 1):
+                decision = deal.decision()
+                if decision is None:
+                    break
+                player, actions = decision
+                for a in actions:
+                    node.available[player, a] = node.available.get((player, a), 0) + 1
+                untried = [a for a in actions if (player, a) not in node.N]
+                if untried:
+                    action = self.rng.choice(untried)
+                else:
+                    action = self._ucb(node, player, actions)
+                edge = (player, action)
+                if deal.cursor[0] == 'place':
+                    pushed.append(deal.boards[player])
+                deal.step(action)
+                path.append((node, edge))
+                if untried or depth == self.max_depth:
+                    break
+                node = node.children.setdefault(edge, InfoNode())
+            rewards = self._evaluate(deal)
+        finally:
+            for board in reversed(pushed):
+                board.pop()
+        for node, edge in path:
+            node.N[edge] = node.N.get(edge, 0) + 1
+            node.W[edge] = node.W.get(edge, 0) + rewards[edge[0]]
+
+    def _evaluate(self, deal):
+        """ Mean rewards of `determinizations` playouts from deal, the unseen box re-dealt for each."""
+        hidden = deal.box  # dominoes whose order nobody knows yet
+        totals = [0.0] * len(deal.boards)
+        for k in range(self.determinizations):
+            sample = deal.copy() if k < self.determinizations - 1 else deal
+            sample.box = self.rng.sample(hidden, len(hidden))
+            for p, r in enumerate(sample.playout(self.rng, self.rollout_policy)):
+                totals[p] += r
+                self.score_scale = max(self.score_scale, abs(r))
+            self.playouts += 1
+        return [t / self.determinizations for t in totals]
+
+    def _ucb(self, node, player, actions):
+        c = self.exploration * self.score_scale
+        return max(actions, key=lambda a: node.W[player, a] / node.N[player, a] +
+                   c * math.sqrt(math.log(node.available[player, a]) / node.N[player, a]))
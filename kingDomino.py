@@ -1,67 +1,300 @@
-from functools import partial
-from pandas import DataFrame
-from os import cpu_count
-from multiprocessing import Pool, Process, Queue, Manager
+from contextlib import contextmanager
+from operator import xor
 import time
 import random
-import copy
+import math
+
+import instrumentation
+from transposition import TranspositionTable
 
 # Move below to statics file?
 TERRAINS = ['wheat', 'water', 'forest', 'cave', 'wasteland', 'sheep', 'castle']
 
-MAXWIDTH = 5
 CASTLE_COORDS = (4, 4)
 CASTLE_ADJ_COORDS = [(4, 3), (4, 5), (3, 4), (5, 4)]
 
-COORD_MAP = {}
+# Terrain code 0 marks an empty cell.
+TERRAIN_CODES = {t: n + 1 for n, t in enumerate(TERRAINS)}
+
+# Compact codes. A cell byte packs terrain code and crowns; a move code packs domino number, side_a cell, orientation
+# and which domino side is side_a. A slot is side_a cell and orientation: cell * len(ORIENTATIONS) + orientation, so
+# move code = (number * N_SLOTS + slot) * 2 + first_side.
+ORIENTATIONS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+ORIENTATION_INDEX = {o: n for n, o in enumerate(ORIENTATIONS)}
+CROWN_SHIFT = 3
+TERRAIN_MASK = (1 << CROWN_SHIFT) - 1  # terrain code bits of a cell byte
+MAX_DOMINO_NUMBER = 48  # highest number in domino_library
+
+# Zobrist keys per (cell, cell byte) are drawn from a fixed seed, so hashes are stable across processes and runs.
+# Boards keep one hash per symmetry: rotations and reflections about the castle.
+ZOBRIST_SEED = 20180131
+SYMMETRIES = [lambda i, j: (i, j), lambda i, j: (-j, i), lambda i, j: (-i, -j), lambda i, j: (j, -i),
+              lambda i, j: (-i, j), lambda i, j: (i, -j), lambda i, j: (j, i), lambda i, j: (-j, -i)]
+NO_HASHES = (0,) * len(SYMMETRIES)
+
+
+class Rules(object):
+    """ Kingdom size and bonus rules, with the tables move generation, hashing and scoring use for that kingdom size.
+    Interned like Side: Rules(maxwidth, middle_kingdom, harmony) always returns the same object, and rules of the same
+    maxwidth share one set of tables, built the first time that width is asked for. Boards and games hold their
+    rules; STANDARD is the 5x5 game, and the module-level tables (COORD_MAP, N_SLOTS, ...) are its tables.
+
+    Cells are numbered over a square grid around the castle at (0, 0), wide enough for a maxwidth x maxwidth kingdom
+    to grow in any direction: 9x9 for 5x5 kingdoms, 13x13 for the 7x7 kingdoms of Mighty Duel. Move codes and encoded
+    boards are relative to that grid, so they only mean something under rules of the same maxwidth.
+
+    middle_kingdom: 10 more points if the castle is at the centre of a maxwidth x maxwidth kingdom.
+    harmony: 5 more points if the kingdom fills its maxwidth x maxwidth square, which takes every domino dealt to it.
+    """
+    _interned = {}
+
+    def __new__(cls, maxwidth=5, middle_kingdom=False, harmony=False):
+        self = cls._interned.get((maxwidth, middle_kingdom, harmony))
+        if self is None:
+            assert isinstance(maxwidth, int) and maxwidth >= 3, 'maxwidth must be an integer of at least 3.'
+            self = object.__new__(cls)
+            same_width = [r for r in cls._interned.values() if r.maxwidth == maxwidth]
+            if same_width:
+                self.__dict__.update(same_width[0].__dict__)  # shares the tables, window_mask's cache included
+            else:
+                self._build_tables(maxwidth)
+            self.middle_kingdom = middle_kingdom
+            self.harmony = harmony
+            self.has_bonus = middle_kingdom or harmony
+            cls._interned[maxwidth, middle_kingdom, harmony] = self
+        return self
+
+    def _build_tables(self, maxwidth):
+        self.maxwidth = maxwidth
+        self.area = maxwidth * maxwidth  # cells of a full kingdom, castle included
+        self.kingdom_dominoes = (self.area - 1) // 2  # dominoes it takes to fill one
+        self.span = range(1 - maxwidth, maxwidth)  # i and j over the grid
+        self.centred = (-(maxwidth // 2), maxwidth // 2) * 2  # iMin, iMax, jMin, jMax of a kingdom around its castle
 
-counter = 0
-for i in range(-4, 5):
-    for j in range(-4, 5):
         # Number gridpoints with integers
-        COORD_MAP.update({(j, i): counter})
-        counter += 1
+        self.coord_map = {}
+        for i in self.span:
+            for j in self.span:
+                self.coord_map[j, i] = len(self.coord_map)
+        self.rev_coord_map = {v: k for k, v in self.coord_map.items()}
+        self.n_cells = n_cells = len(self.coord_map)
+        self.castle_cell = self.coord_map[0, 0]
+        self.cell_coords = [self.rev_coord_map[c] for c in range(n_cells)]
+        self.cell_neighbors = []
+        self.neighbor_mask = []
+        for c in range(n_cells):
+            ci, cj = self.cell_coords[c]
+            nbrs = tuple(self.coord_map[ci + di, cj + dj] for di, dj in ORIENTATIONS
+                         if (ci + di, cj + dj) in self.coord_map)
+            self.cell_neighbors.append(nbrs)
+            self.neighbor_mask.append(sum(1 << n for n in nbrs))
+
+        self.n_slots = n_cells * len(ORIENTATIONS)
+        # slot -> (i, j, Di, Dj)
+        self.slot_placements = [self.cell_coords[c] + o for c in range(n_cells) for o in ORIENTATIONS]
+        # slot -> (side_a cell, side_b cell); side_b's cell is None where it would be off the grid
+        self.slot_cells = [(self.coord_map[i, j], self.coord_map.get((i + Di, j + Dj)))
+                           for i, j, Di, Dj in self.slot_placements]
+        # Every move code is below move_code_limit, a power of two, so higher bits can flag other entries; see game.py.
+        self.move_code_limit = 1 << ((MAX_DOMINO_NUMBER + 1) * self.n_slots * 2 - 1).bit_length()
+
+        # symmetry_cells[s][c] is cell c under SYMMETRIES[s].
+        rng = random.Random(ZOBRIST_SEED)
+        self.zobrist = [[rng.getrandbits(64) for code in range(1 << (CROWN_SHIFT + 2))] for c in range(n_cells)]
+        self.symmetry_cells = [[self.coord_map[f(*self.cell_coords[c])] for c in range(n_cells)] for f in SYMMETRIES]
+        # symmetry_keys[c][code] is what a side with cell byte code on cell c XORs into each of a board's hashes.
+        self.symmetry_keys = [[tuple(self.zobrist[cells[c]][code] for cells in self.symmetry_cells)
+                               for code in range(1 << (CROWN_SHIFT + 2))] for c in range(n_cells)]
+
+        # Every placement with side_a on a given cell: (other cell, i, j, Di, Dj, and the i/j bounding box of the two
+        # cells).
+        self.placements = []
+        for c in range(n_cells):
+            ci, cj = self.cell_coords[c]
+            self.placements.append(tuple((self.coord_map[ci + Di, cj + Dj], ci, cj, Di, Dj, min(ci, ci + Di),
+                                          max(ci, ci + Di), min(cj, cj + Dj), max(cj, cj + Dj))
+                                         for Di, Dj in ORIENTATIONS if (ci + Di, cj + Dj) in self.coord_map))
+        # The same placements indexed by side_b's cell: (side_a cell, i, j, Di, Dj, bounding box).
+        placements_to = [[] for c in range(n_cells)]
+        for c in range(n_cells):
+            for p in self.placements[c]:
+                placements_to[p[0]].append((c,) + p[1:])
+        self.placements_to = [tuple(p) for p in placements_to]
+        # Slim copies for move generation: (other cell, slot) by side_a's cell, and (side_a cell, slot) by side_b's
+        # cell.
+        self.slots_from = [tuple((p[0], c * len(ORIENTATIONS) + ORIENTATION_INDEX[p[3], p[4]])
+                                 for p in self.placements[c]) for c in range(n_cells)]
+        self.slots_to = [tuple((p[0], p[0] * len(ORIENTATIONS) + ORIENTATION_INDEX[p[3], p[4]])
+                               for p in self.placements_to[c]) for c in range(n_cells)]
+        self._windows = {}
+
+    def __reduce__(self):
+        return Rules, (self.maxwidth, self.middle_kingdom, self.harmony)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
-REV_COORD_MAP = {v: k for k, v in COORD_MAP.items()}
+    def __repr__(self):
+        bonuses = [name for name, on in (('middle kingdom', self.middle_kingdom), ('harmony', self.harmony)) if on]
+        return 'Rules(%dx%d%s)' % (self.maxwidth, self.maxwidth, ''.join(', ' + b for b in bonuses))
+
+    def window_mask(self, iMin, iMax, jMin, jMax):
+        """ Cells where a new side keeps a kingdom with these bounds (castle included) within maxwidth."""
+        key = (iMin, iMax, jMin, jMax)
+        mask = self._windows.get(key)
+        if mask is None:
+            mask = 0
+            maxwidth = self.maxwidth
+            for c, (i, j) in enumerate(self.cell_coords):
+                if iMax - maxwidth < i < iMin + maxwidth and jMax - maxwidth < j < jMin + maxwidth:
+                    mask |= 1 << c
+            self._windows[key] = mask
+        return mask
+
+    def feasible_placements(self, frontier, open_cells, adj_a, adj_b):
+        """ Slots of every placement with both cells in open_cells (empty and within the width window) that
+        touches the kingdom through side A on a cell of adj_a or side B on a cell of adj_b. Every such placement has a
+        side on the frontier: placements come from the table with side A on the frontier, or side B on the frontier and
+        side A outside it."""
+        slots_from = self.slots_from
+        slots_to = self.slots_to
+        placements = []
+        frontier &= open_cells
+        rest = frontier
+        while rest:
+            low = rest & -rest
+            rest ^= low
+            a = low.bit_length() - 1
+            if (adj_a >> a) & 1:
+                for b, slot in slots_from[a]:
+                    if (open_cells >> b) & 1:
+                        placements.append(slot)
+            else:
+                for b, slot in slots_from[a]:
+                    if (open_cells >> b) & 1 and (adj_b >> b) & 1:
+                        placements.append(slot)
+            if (adj_b >> a) & 1:
+                for x, slot in slots_to[a]:
+                    if (open_cells >> x) & 1 and not (frontier >> x) & 1:
+                        placements.append(slot)
+        return placements
+
+    def encode_move(self, move):
+        """ Small integer identifying move; decode_move reverses it."""
+        slot = self.coord_map[move.i, move.j] * len(ORIENTATIONS) + ORIENTATION_INDEX[move.Di, move.Dj]
+        return (move.domino.number * self.n_slots + slot) * 2 + move.first_side
+
+    def placement_move(self, domino, code):
+        """ Move of domino for a move code; the domino number in the code is not checked."""
+        i, j, Di, Dj = self.slot_placements[(code >> 1) % self.n_slots]
+        return Move(domino, code & 1, i, j, Di, Dj)
+
+    def decode_move(self, code, dominos_by_number):
+        """ Move for a code from encode_move, looking the domino up in a dict keyed by domino number."""
+        return self.placement_move(dominos_by_number[(code >> 1) // self.n_slots], code)
+
+    def bonus(self, board):
+        """ Middle Kingdom and Harmony points of board under these rules."""
+        points = 0
+        if self.middle_kingdom and (board.iMin, board.iMax, board.jMin, board.jMax) == self.centred:
+            points += 10
+        if self.harmony and board.is_full():
+            points += 5
+        return points
+
+
+STANDARD = Rules()
+
+MAXWIDTH = STANDARD.maxwidth
+COORD_MAP = STANDARD.coord_map
+REV_COORD_MAP = STANDARD.rev_coord_map
+N_CELLS = STANDARD.n_cells
+CELL_COORDS = STANDARD.cell_coords
+CELL_NEIGHBORS = STANDARD.cell_neighbors
+NEIGHBOR_MASK = STANDARD.neighbor_mask
+N_SLOTS = STANDARD.n_slots
+SLOT_PLACEMENTS = STANDARD.slot_placements
+SLOT_CELLS = STANDARD.slot_cells
+ZOBRIST = STANDARD.zobrist
+SYMMETRY_CELLS = STANDARD.symmetry_cells
+PLACEMENTS = STANDARD.placements
+PLACEMENTS_TO = STANDARD.placements_to
+SLOTS_FROM = STANDARD.slots_from
+SLOTS_TO = STANDARD.slots_to
+window_mask = STANDARD.window_mask
+feasible_placements = STANDARD.feasible_placements
 
 
 class Side(object):
-
-    def __init__(self, kings, terrain):
-        assert isinstance(kings, int), 'Kings must be an integer.'
-        assert terrain in TERRAINS, 'Unrecognized terrain: ' + terrain
-        self.kings = kings
-        self.terrain = terrain
+    """ Interned: Side(kings, terrain) always returns the same object for the same values, so there is one Side per
+    (kings, terrain) and sides compare by identity. code is the cell byte, see CROWN_SHIFT."""
+    __slots__ = ('kings', 'terrain', 'code')
+    _interned = {}
+
+    def __new__(cls, kings, terrain):
+        self = cls._interned.get((kings, terrain))
+        if self is None:
+            assert isinstance(kings, int), 'Kings must be an integer.'
+            assert terrain in TERRAINS, 'Unrecognized terrain: ' + terrain
+            self = object.__new__(cls)
+            self.kings = kings
+            self.terrain = terrain
+            self.code = TERRAIN_CODES[terrain] | kings << CROWN_SHIFT
+            cls._interned[kings, terrain] = self
+        return self
+
+    def __reduce__(self):
+        return Side, (self.kings, self.terrain)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __eq__(self, other):
-        assert isinstance(other, Side), 'Invalid comparison.'
-        equal = True
-        equal &= self.kings == other.kings
-        equal &= self.terrain == other.terrain
-        return equal
-
-    def __ne__(self, other):
-        assert isinstance(other, Side), 'Invalid comparison.'
-        if not self.__eq__(other):
-            return True
-        return False
+        if not isinstance(other, Side):
+            return NotImplemented
+        return self is other
 
     def __repr__(self):
         return self.terrain + ', k=' + str(self.kings)
 
     def __hash__(self):
-        return hash((self.kings, self.terrain))
+        return self.code
 
 
 class Domino(object):
-
-    def __init__(self, one_side, other_side, number):
-        self.one_side = one_side
-        self.other_side = other_side
-        self.number = number
+    """ Interned like Side: one object per (sides, number), 48 for the whole library. Dominoes compare by identity, so
+    two with the same sides are still two dominoes in a deck or set; branch_and_bound.domino_kind is their common
+    key."""
+    __slots__ = ('one_side', 'other_side', 'number')
+    _interned = {}
+
+    def __new__(cls, one_side, other_side, number):
+        self = cls._interned.get((one_side, other_side, number))
+        if self is None:
+            self = object.__new__(cls)
+            self.one_side = one_side
+            self.other_side = other_side
+            self.number = number
+            cls._interned[one_side, other_side, number] = self
+        return self
+
+    def __reduce__(self):
+        return Domino, (self.one_side, self.other_side, self.number)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
 
     def __hash__(self):
-        return hash((self.one_side, self.other_side))
+        return self.number
 
     def __repr__(self):
         return 'A: ' + self.one_side.terrain + ', k=' + str(self.one_side.kings) + \
@@ -72,31 +305,16 @@ class Domino(object):
         if item == 0:
             return self.one_side
         return self.other_side
-    
-    def __eq__(self, other):
-        """
-        Will consider like Dominos equal even if their numbers are different.
-        """
-        assert isinstance(other, Domino)
-        equal = True
-        if self.one_side == other.one_side:
-            if self.other_side == other.other_side:
-                return True
-        if self.one_side == other.other_side:
-            if self.other_side == other.one_side:
-                return True
-        return False
 
-    def __ne__(self, other):
-        if self.__eq__(other):
-            return False
-        return True
+    def __eq__(self, other):
+        if not isinstance(other, Domino):
+            return NotImplemented
+        return self is other
 
     def __lt__(self, other):
-        if self.number < other.number:
-            return True
-        else:
-            return False
+        if not isinstance(other, Domino):
+            return NotImplemented
+        return self.number < other.number
 
     def get_other_side(self, side):
         if side == self.one_side:
@@ -108,7 +326,8 @@ class Domino(object):
 
 
 class Board(object):
-    def __init__(self):
+    def __init__(self, rules=STANDARD):
+        self.rules = rules  # kingdom size and bonus rules; cells are numbered by its coord_map
         self.B = {}  # collection of sides, keyed by (i, j) tuple of integers
         self.iMax = None
         self.iMin = None
@@ -117,17 +336,40 @@ class Board(object):
         self.Edges = []
         self.Graph = {}
         self.connected_components = []
+        # Union-find over graph nodes, maintained as nodes and edges are added. Sizes and crowns are kept per root.
+        # Merges are logged so pop() can undo them.
+        self.region_parent = {}
+        self.region_size = {}
+        self.region_kings = {}
+        self.region_merges = []
+        self.score = 0
+        self.undo_stack = []
+        # Cell bitmasks (coord_map numbering) for move generation: occupied cells, empty cells adjacent to the kingdom,
+        # and per terrain the cells adjacent to a side of that terrain.
+        self.occupied = 0
+        self.frontier = 0
+        self.terrain_adjacency = {}
+        self.zobrist = NO_HASHES  # one Zobrist hash per entry of SYMMETRIES; the castle is not hashed
         self.castle_adj_coords = []
         self.castle_coords = ()
         self.place_castle()
 
     def show(self):
-        print(self.make_visual_board())
+        print(render_cells(self.encode(), self.rules))
+
+    def encode(self):
+        """ One byte per cell of the rules' grid: terrain code plus crowns << CROWN_SHIFT. See decode_board."""
+        coord_map = self.rules.coord_map
+        cells = bytearray(self.rules.n_cells)
+        for coords, side in self.B.items():
+            cells[coord_map[coords]] = TERRAIN_CODES[side.terrain] | side.kings << CROWN_SHIFT
+        return bytes(cells)
 
     def place_castle(self):
         castle_coords = (0, 0)  # It's at the center
         self.castle_coords = castle_coords
         self.B[castle_coords] = Side(kings=0, terrain='castle')
+        self.update_frontier(self.rules.castle_cell)
         for iBump, jBump in [(1, 0), (-1, 0), (0, 1), (0, -1)]:
             self.castle_adj_coords += [(castle_coords[0] + iBump, castle_coords[1] + jBump)]
 
@@ -136,8 +378,13 @@ class Board(object):
 
     def assign_domino(self, move):
         if self.check_move_validity(move):
+            coord_map = self.rules.coord_map
             self.B[move.i, move.j] = move.side_a
             self.B[move.i2, move.j2] = move.side_b
+            self.update_frontier(coord_map[move.i, move.j], move.side_a.terrain)
+            self.update_frontier(coord_map[move.i2, move.j2], move.side_b.terrain)
+            self.update_zobrist(coord_map[move.i, move.j], move.side_a)
+            self.update_zobrist(coord_map[move.i2, move.j2], move.side_b)
             try:
                 self.record_external_edge_formation(move)
             except:
@@ -146,7 +393,7 @@ class Board(object):
             self.update_max_min(move)
             if move.side_a.terrain == move.side_b.terrain:
                 # Record internal edge if both sides of domino have same terrain
-                edge = (COORD_MAP[move.i, move.j], COORD_MAP[move.i2, move.j2])
+                edge = (coord_map[move.i, move.j], coord_map[move.i2, move.j2])
                 self.Edges += [edge]
                 self.update_graph(move, edge)
             else:
@@ -157,8 +404,8 @@ class Board(object):
 
     def update_graph(self, move, edge=None):
         """ Add node and edge to graph."""
-        m1 = COORD_MAP[move.i, move.j]
-        m2 = COORD_MAP[move.i2, move.j2]
+        m1 = self.rules.coord_map[move.i, move.j]
+        m2 = self.rules.coord_map[move.i2, move.j2]
 
         if edge is not None:
             e1 = edge[0]
@@ -168,27 +415,140 @@ class Board(object):
 
             if e1 not in self.Graph.keys():
                 self.Graph.update({e1: {e2}})
+                self.add_region_node(e1)
             else:
                 self.Graph[e1].add(e2)
 
             if e2 not in self.Graph.keys():
                 self.Graph.update({e2: {e1}})
+                self.add_region_node(e2)
             else:
                 self.Graph[e2].add(e1)
 
+            self.union_regions(e1, e2)
+
             if m1 not in edge:
                 if m1 not in self.Graph.keys():
                     self.Graph.update({m1: set()})
+                    self.add_region_node(m1)
 
             if m2 not in edge:
                 if m2 not in self.Graph.keys():
                     self.Graph.update({m2: set()})
+                    self.add_region_node(m2)
         else:
             # No edge provided, just add the node.
             if m1 not in self.Graph.keys():
                 self.Graph.update({m1: set()})
+                self.add_region_node(m1)
             if m2 not in self.Graph.keys():
                 self.Graph.update({m2: set()})
+                self.add_region_node(m2)
+
+    def add_region_node(self, node):
+        """ Start a single-cell region for a newly placed side."""
+        kings = self.B[self.rules.rev_coord_map[node]].kings
+        self.region_parent[node] = node
+        self.region_size[node] = 1
+        self.region_kings[node] = kings
+        self.score += kings
+
+    def find_region(self, node):
+        """ Root of the region containing node. Union by size keeps trees shallow; there is no path compression, so
+        merges can be undone exactly."""
+        parent = self.region_parent
+        while parent[node] != node:
+            node = parent[node]
+        return node
+
+    def union_regions(self, n1, n2):
+        r1 = self.find_region(n1)
+        r2 = self.find_region(n2)
+        if r1 == r2:
+            return
+        if self.region_size[r1] < self.region_size[r2]:
+            r1, r2 = r2, r1
+        s1, s2 = self.region_size[r1], self.region_size[r2]
+        k1, k2 = self.region_kings[r1], self.region_kings[r2]
+        self.score += (s1 + s2) * (k1 + k2) - s1 * k1 - s2 * k2
+        self.region_merges.append((r1, r2, s1, k1, s2, k2))
+        self.region_parent[r2] = r1
+        self.region_size[r1] = s1 + s2
+        self.region_kings[r1] = k1 + k2
+        del self.region_size[r2]
+        del self.region_kings[r2]
+
+    def push(self, move):
+        """ Assign move and remember how to revert it with pop(). Returns False, pushing nothing, if the move is
+        invalid."""
+        frame = (move, len(self.Edges), len(self.region_merges), self.score, self.iMax, self.iMin, self.jMax, self.jMin,
+                 self.occupied, self.frontier, dict(self.terrain_adjacency), self.zobrist)
+        if not self.assign_domino(move):
+            return False
+        self.undo_stack.append(frame)
+        return True
+
+    def pop(self):
+        """ Revert the most recent push() exactly."""
+        (move, n_edges, n_merges, self.score, self.iMax, self.iMin, self.jMax, self.jMin,
+         self.occupied, self.frontier, self.terrain_adjacency, self.zobrist) = self.undo_stack.pop()
+
+        while len(self.region_merges) > n_merges:
+            r1, r2, s1, k1, s2, k2 = self.region_merges.pop()
+            self.region_parent[r2] = r2
+            self.region_size[r1], self.region_kings[r1] = s1, k1
+            self.region_size[r2], self.region_kings[r2] = s2, k2
+
+        for e1, e2 in self.Edges[n_edges:]:
+            self.Graph[e1].discard(e2)
+            self.Graph[e2].discard(e1)
+        del self.Edges[n_edges:]
+
+        for coords in ((move.i, move.j), (move.i2, move.j2)):
+            node = self.rules.coord_map[coords]
+            del self.Graph[node]
+            del self.region_parent[node]
+            del self.region_size[node]
+            del self.region_kings[node]
+            del self.B[coords]
+        return move
+
+    @contextmanager
+    def placed(self, move):
+        """ Context manager applying a valid move for the duration of the block."""
+        assert self.push(move), 'Cannot place an invalid move.'
+        try:
+            yield self
+        finally:
+            self.pop()
+
+    def is_full(self):
+        """ True once the kingdom fills its maxwidth x maxwidth square."""
+        return bin(self.occupied).count('1') >= self.rules.area
+
+    def update_zobrist(self, cell, side):
+        code = TERRAIN_CODES[side.terrain] | side.kings << CROWN_SHIFT
+        self.zobrist = tuple(map(xor, self.zobrist, self.rules.symmetry_keys[cell][code]))
+
+    def zobrist_hash(self):
+        """ Zobrist hash of the kingdom. Equal for a Board and a BitBoard holding the same sides."""
+        return self.zobrist[0]
+
+    def canonical_hash(self):
+        """ Hash shared by all rotations and reflections of the kingdom about the castle."""
+        return min(self.zobrist)
+
+    def canonical_symmetry(self):
+        """ Index into SYMMETRIES of the transform whose hash is canonical_hash()."""
+        return self.zobrist.index(min(self.zobrist))
+
+    def update_frontier(self, cell, terrain=None):
+        """ Mark cell occupied and extend the frontier and terrain adjacency masks around it."""
+        nbrs = self.rules.neighbor_mask[cell]
+        self.occupied |= 1 << cell
+        self.frontier = (self.frontier | nbrs) & ~self.occupied
+        if terrain is not None:
+            self.terrain_adjacency[terrain] = self.terrain_adjacency.get(terrain, 0) | nbrs
 
     def update_max_min(self, move=None):
         """ Keep track of largest and least i and j to ensure grid fits into 5x5 square"""
@@ -248,10 +608,10 @@ class Board(object):
         else:
             jMin = min(self.jMin, move.j, move.j2, cj)
 
-        if iMax - iMin >= MAXWIDTH:
+        if iMax - iMin >= self.rules.maxwidth:
             return False
 
-        if jMax - jMin >= MAXWIDTH:
+        if jMax - jMin >= self.rules.maxwidth:
             return False
 
         return True
@@ -295,7 +655,7 @@ class Board(object):
                 if (step_i, step_j) in self.B.keys():
                     existing_terrain = self.B[step_i, step_j].terrain
                     if existing_terrain == move.side_a.terrain:
-                        edge = (COORD_MAP[move.i, move.j], COORD_MAP[step_i, step_j])
+                        edge = (self.rules.coord_map[move.i, move.j], self.rules.coord_map[step_i, step_j])
                         self.Edges += [edge]
                         self.update_graph(move, edge)
 
@@ -306,7 +666,7 @@ class Board(object):
                 if (step_i, step_j) in self.B.keys():
                     existing_terrain = self.B[step_i, step_j].terrain
                     if existing_terrain == move.side_b.terrain:
-                        edge = (COORD_MAP[move.i2, move.j2], COORD_MAP[step_i, step_j])
+                        edge = (self.rules.coord_map[move.i2, move.j2], self.rules.coord_map[step_i, step_j])
                         self.Edges += [edge]
                         self.update_graph(move, edge)
 
@@ -364,36 +724,126 @@ class Board(object):
         return visited
 
     def score_kings(self):
-        self.find_connected_components()
-        total_score = 0
-        for comp in self.connected_components:
-            k = 0
-            for c in comp:
-                side = self.B[REV_COORD_MAP[c]]
-                k += side.kings
-            component_score = k * len(comp)
-            total_score += component_score
-        return total_score
+        """ Current score, kept up to date by the region union-find as dominoes are assigned."""
+        return self.score
+
+    def final_score(self):
+        """ score_kings() plus the bonus points of the rules, if they have any (see Rules.bonus): what a finished
+        kingdom scores."""
+        if self.rules.has_bonus:
+            return self.score + self.rules.bonus(self)
+        return self.score
+
+    def regions(self):
+        """ (size, crowns) of every connected terrain region."""
+        return [(self.region_size[r], self.region_kings[r]) for r in self.region_size]
+
+    def score_delta(self, move):
+        """ Change in score_kings() that assign_domino(move) would cause. Assumes the move is valid; the board is not
+        modified."""
+        coord_map = self.rules.coord_map
+        return self.placement_gain(coord_map[move.i, move.j], coord_map[move.i2, move.j2], move.side_a,
+                                   move.side_b)[0]
+
+    def placement_gain(self, a, b, side_a, side_b):
+        """ (change in score, existing regions joined) if side_a went on empty cell a and side_b on the adjacent empty
+        cell b. The board is not modified."""
+        ta = side_a.code & TERRAIN_MASK
+        tb = side_b.code & TERRAIN_MASK
+        if ta == tb:
+            roots = self.adjacent_regions(a, ta) | self.adjacent_regions(b, ta)
+            return self.merged_gain(roots, 2, side_a.kings + side_b.kings), len(roots)
+        roots_a = self.adjacent_regions(a, ta)
+        roots_b = self.adjacent_regions(b, tb)
+        return (self.merged_gain(roots_a, 1, side_a.kings) + self.merged_gain(roots_b, 1, side_b.kings),
+                len(roots_a) + len(roots_b))
+
+    def score_deltas(self, domino, codes=None):
+        """ Change in score_kings() for each move code of domino (by default every feasible one), in the order of
+        codes, without modifying the board. The gain of each side of the domino on each cell is worked out once per
+        call, so a placement whose sides differ in terrain costs two table lookups and an addition. Placements with
+        both sides of one terrain merge the regions next to either cell."""
+        if codes is None:
+            codes = self.feasible_codes(domino)
+        sides = (domino.one_side, domino.other_side)
+        terrains = (sides[0].code & TERRAIN_MASK, sides[1].code & TERRAIN_MASK)
+        kings = (sides[0].kings, sides[1].kings)
+        slot_cells = self.rules.slot_cells
+        n_slots = self.rules.n_slots
+        deltas = []
+        if terrains[0] == terrains[1]:
+            roots = {}  # cell -> adjacent regions of the domino's terrain
+            for code in codes:
+                a, b = slot_cells[(code >> 1) % n_slots]
+                roots_a = roots.get(a)
+                if roots_a is None:
+                    roots_a = roots[a] = self.adjacent_regions(a, terrains[0])
+                roots_b = roots.get(b)
+                if roots_b is None:
+                    roots_b = roots[b] = self.adjacent_regions(b, terrains[0])
+                deltas.append(self.merged_gain(roots_a | roots_b, 2, kings[0] + kings[1]))
+            return deltas
+        gains = ({}, {})  # per domino side: cell -> gain of that side alone on that cell
+        for code in codes:
+            a, b = slot_cells[(code >> 1) % n_slots]
+            x = code & 1  # the domino side on cell a
+            gain_a = gains[x].get(a)
+            if gain_a is None:
+                gain_a = gains[x][a] = self.merged_gain(self.adjacent_regions(a, terrains[x]), 1, kings[x])
+            gain_b = gains[1 - x].get(b)
+            if gain_b is None:
+                gain_b = gains[1 - x][b] = self.merged_gain(self.adjacent_regions(b, terrains[1 - x]), 1,
+                                                            kings[1 - x])
+            deltas.append(gain_a + gain_b)
+        return deltas
+
+    def merged_gain(self, roots, size, kings):
+        """ Change in score when a new piece of size cells and kings crowns joins the regions roots."""
+        delta = 0
+        for r in roots:
+            delta -= self.region_size[r] * self.region_kings[r]
+            size += self.region_size[r]
+            kings += self.region_kings[r]
+        return delta + size * kings
+
+    def adjacent_regions(self, c, terrain_code):
+        """ Roots of the regions of that terrain next to cell c."""
+        roots = set()
+        cell_coords = self.rules.cell_coords
+        region_parent = self.region_parent
+        for n in self.rules.cell_neighbors[c]:
+            if n in region_parent and self.B[cell_coords[n]].code & TERRAIN_MASK == terrain_code:
+                roots.add(self.find_region(n))
+        return roots
+
+    def open_cells(self):
+        """ Bitmask of empty cells a new side could take without breaking the maxwidth limit."""
+        ci, cj = self.castle_coords
+        iMax = ci if self.iMax is None else max(self.iMax, ci)
+        iMin = ci if self.iMin is None else min(self.iMin, ci)
+        jMax = cj if self.jMax is None else max(self.jMax, cj)
+        jMin = cj if self.jMin is None else min(self.jMin, cj)
+        return self.rules.window_mask(iMin, iMax, jMin, jMax) & ~self.occupied
 
     def get_feasible_move_set(self, domino):
-        """ Returns all moves that are valid, given self and domino """
+        """ Returns all moves that are valid, given self and domino."""
+        return {self.rules.placement_move(domino, code) for code in self.feasible_codes(domino)}
+
+    def feasible_codes(self, domino):
+        """ Move codes (see encode_move) of every valid placement of domino, in a fixed order. See
+        Rules.feasible_placements."""
         assert isinstance(domino, Domino), 'Please pass a king domino "Domino" object.'
 
-        feasible_set = set()
-        for coords, side in self.B.items():
-            i_existing = coords[0]
-            j_existing = coords[1]
-            for iBump, jBump in [(1, 0), (-1, 0), (0, 1), (0, -1)]:  # Test all adjacencies to each existing side
-
-                i = i_existing + iBump
-                j = j_existing + jBump
-                for Di, Dj in [(1, 0), (-1, 0), (0, 1), (0, -1)]:  # Test all rotations
-                    candidate_move = Move(domino=domino, first_side=0, i=i, j=j, Di=Di, Dj=Dj)
-                    if self.check_move_validity(candidate_move):
-                        feasible_set.add(candidate_move)
-        return feasible_set
+        rules = self.rules
+        castle_mask = rules.neighbor_mask[rules.castle_cell]
+        adj_a = self.terrain_adjacency.get(domino[0].terrain, 0) | castle_mask
+        adj_b = self.terrain_adjacency.get(domino[1].terrain, 0) | castle_mask
+        base = domino.number * rules.n_slots
+        return [(base + slot) * 2 for slot in rules.feasible_placements(self.frontier, self.open_cells(), adj_a, adj_b)]
 
     def make_visual_board(self):
+        """ The kingdom as a pandas DataFrame of Sides. pandas is only imported here; show() prints plain text."""
+        from pandas import DataFrame
         visual_board = DataFrame(index=[x for x in range(-5, 4)], columns=[x for x in range(-5, 4)])
         for k, v in self.B.items():
             visual_board.loc[k[0], k[1]] = v
@@ -404,11 +854,15 @@ class Board(object):
 
 
 class Move(object):
+    """ A placement, as handed to and from the API. Searches and move generation work on integer move codes (see
+    encode_move) and make Moves only when they are asked for."""
+    __slots__ = ('domino', 'first_side', 'side_a', 'side_b', 'i', 'j', 'Di', 'Dj', 'i2', 'j2')
 
     def __init__(self, domino, first_side, i, j, Di, Dj):
         # side_a goes in spot (i, j)
         # side_b goes in spot (i + Di, j + Dj)
         self.domino = domino
+        self.first_side = first_side
         self.side_a = domino[first_side]
         self.side_b = domino[0 if first_side else 1]
         self.i = i
@@ -417,23 +871,12 @@ class Move(object):
         self.Dj = Dj
         self.i2 = i + Di
         self.j2 = j + Dj
-    
+
     def __eq__(self, other):
-        assert isinstance(other, Move), 'Invalid comparison.'
-        equal = True
-        equal &= self.domino == other.domino
-        equal &= self.i == other.i
-        equal &= self.j == other.j
-        equal &= self.Di == other.Di
-        equal &= self.Dj == other.Dj
-        equal &= self.i2 == other.i2
-        equal &= self.j2 == other.j2
-        return equal
-    
-    def __ne__(self, other):
-        if self.__eq__(other):
-            return False
-        return True
+        if not isinstance(other, Move):
+            return NotImplemented
+        return (self.side_a is other.side_a and self.side_b is other.side_b and self.i == other.i and
+                self.j == other.j and self.Di == other.Di and self.Dj == other.Dj)
 
     def __hash__(self):
         return hash((self.side_a, self.side_b, self.i, self.j, self.Di, self.Dj))
@@ -445,50 +888,576 @@ class Move(object):
                                                                                   self.side_b.kings)
 
 
+class BitBoard(object):
+    """ Compact alternative to Board with the same move/score API. Terrain codes and crown counts are stored in flat
+    bytearrays indexed by the rules' coord_map, and occupancy is an integer bitmask, so copies and comparisons are
+    cheap."""
+
+    def __init__(self, rules=STANDARD):
+        self.rules = rules  # kingdom size and bonus rules, see Rules
+        n_cells = rules.n_cells
+        self.terrain = bytearray(n_cells)
+        self.kings = bytearray(n_cells)
+        self.occupied = 0
+        self.frontier = 0  # empty cells adjacent to the kingdom
+        self.castle_coords = (0, 0)
+        # Bounds start at the castle, which check_if_grid_within_width_limits always includes anyway.
+        self.iMax = self.iMin = self.jMax = self.jMin = 0
+        self.undo_stack = []
+        self.zobrist = NO_HASHES  # one Zobrist hash per entry of SYMMETRIES; the castle is not hashed
+        self.adjacency = [0] * (len(TERRAINS) + 1)  # per terrain code, cells adjacent to a side of that terrain
+        # Regions, kept up to date as cells are set: region[c] is 1 + the root cell of c's region (0 for empty cells
+        # and the castle), and region_size/region_kings are indexed by root cell.
+        self.region = bytearray(n_cells)
+        self.region_size = bytearray(n_cells)
+        self.region_kings = bytearray(n_cells)
+        self.score = 0
+        self.place_castle()
+
+    def place_castle(self):
+        c = self.rules.castle_cell
+        self.castle_cell = c
+        self._set_cell(c, TERRAIN_CODES['castle'], 0)
+
+    def _set_cell(self, c, terrain_code, kings):
+        rules = self.rules
+        nbrs = rules.neighbor_mask[c]
+        self.terrain[c] = terrain_code
+        self.kings[c] = kings
+        self.occupied |= 1 << c
+        self.frontier = (self.frontier | nbrs) & ~self.occupied
+        self.adjacency[terrain_code] |= nbrs
+        if terrain_code != TERRAIN_CODES['castle']:
+            self.zobrist = tuple(map(xor, self.zobrist, rules.symmetry_keys[c][terrain_code | kings << CROWN_SHIFT]))
+            self._join_region(c, terrain_code, kings)
+
+    def _join_region(self, c, terrain_code, kings):
+        """ Add cell c to the regions: merge its same-terrain neighbors' regions into the largest one."""
+        region = self.region
+        roots = {region[n] - 1 for n in self.rules.cell_neighbors[c] if region[n] and self.terrain[n] == terrain_code}
+        size = 1
+        for r in roots:
+            self.score -= self.region_size[r] * self.region_kings[r]
+            size += self.region_size[r]
+            kings += self.region_kings[r]
+        keep = max(roots, key=self.region_size.__getitem__) if roots else c
+        if len(roots) > 1:
+            relabel = bytearray(range(256))
+            for r in roots:
+                relabel[r + 1] = keep + 1
+            self.region = region = region.translate(relabel)
+        region[c] = keep + 1
+        self.region_size[keep] = size
+        self.region_kings[keep] = kings
+        self.score += size * kings
+
+    zobrist_hash = Board.zobrist_hash
+    canonical_hash = Board.canonical_hash
+    canonical_symmetry = Board.canonical_symmetry
+
+    def is_full(self):
+        """ True once the kingdom fills its maxwidth x maxwidth square."""
+        return bin(self.occupied).count('1') >= self.rules.area
+
+    def __getitem__(self, ij):
+        c = self.rules.coord_map[ij]
+        if not self.terrain[c]:
+            raise KeyError(ij)
+        return Side(kings=self.kings[c], terrain=TERRAINS[self.terrain[c] - 1])
+
+    def __eq__(self, other):
+        if not isinstance(other, BitBoard):
+            return NotImplemented
+        return self.terrain == other.terrain and self.kings == other.kings
+
+    __hash__ = None
+
+    def encode(self):
+        """ One byte per cell of the rules' grid: terrain code plus crowns << CROWN_SHIFT. See decode_board."""
+        return bytes(t | k << CROWN_SHIFT for t, k in zip(self.terrain, self.kings))
+
+    def copy(self):
+        bc = BitBoard.__new__(BitBoard)
+        bc.__dict__.update(self.__dict__)
+        bc.terrain = bytearray(self.terrain)
+        bc.kings = bytearray(self.kings)
+        bc.region = bytearray(self.region)
+        bc.region_size = bytearray(self.region_size)
+        bc.region_kings = bytearray(self.region_kings)
+        bc.adjacency = list(self.adjacency)
+        bc.undo_stack = list(self.undo_stack)
+        return bc
+
+    __copy__ = copy
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def show(self):
+        print(self.make_visual_board())
+
+    def make_visual_board(self):
+        return render_cells(self.encode(), self.rules)
+
+    def assign_domino(self, move):
+        if self.check_move_validity(move):
+            coord_map = self.rules.coord_map
+            self._set_cell(coord_map[move.i, move.j], TERRAIN_CODES[move.side_a.terrain], move.side_a.kings)
+            self._set_cell(coord_map[move.i2, move.j2], TERRAIN_CODES[move.side_b.terrain], move.side_b.kings)
+            self.iMax = max(self.iMax, move.i, move.i2)
+            self.iMin = min(self.iMin, move.i, move.i2)
+            self.jMax = max(self.jMax, move.j, move.j2)
+            self.jMin = min(self.jMin, move.j, move.j2)
+            return True
+        return False
+
+    def push(self, move):
+        """ Assign move and remember how to revert it with pop(). Returns False, pushing nothing, if the move is
+        invalid."""
+        frame = (move, self.iMax, self.iMin, self.jMax, self.jMin, self.occupied, self.frontier, self.zobrist,
+                 list(self.adjacency), bytes(self.region), bytes(self.region_size), bytes(self.region_kings),
+                 self.score)
+        if not self.assign_domino(move):
+            return False
+        self.undo_stack.append(frame)
+        return True
+
+    def pop(self):
+        """ Revert the most recent push() exactly."""
+        (move, self.iMax, self.iMin, self.jMax, self.jMin, self.occupied, self.frontier,
+         self.zobrist, self.adjacency, region, region_size, region_kings, self.score) = self.undo_stack.pop()
+        self.region[:] = region
+        self.region_size[:] = region_size
+        self.region_kings[:] = region_kings
+        coord_map = self.rules.coord_map
+        for c in (coord_map[move.i, move.j], coord_map[move.i2, move.j2]):
+            self.terrain[c] = 0
+            self.kings[c] = 0
+        return move
+
+    @contextmanager
+    def placed(self, move):
+        """ Context manager applying a valid move for the duration of the block."""
+        assert self.push(move), 'Cannot place an invalid move.'
+        try:
+            yield self
+        finally:
+            self.pop()
+
+    def check_if_grid_within_width_limits(self, move):
+        """ Make sure the move doesn't expand board too wide/long. Return True if OK."""
+        maxwidth = self.rules.maxwidth
+        if max(self.iMax, move.i, move.i2) - min(self.iMin, move.i, move.i2) >= maxwidth:
+            return False
+        if max(self.jMax, move.j, move.j2) - min(self.jMin, move.j, move.j2) >= maxwidth:
+            return False
+        return True
+
+    def check_castle_adjacency(self, move):
+        castle_bit = 1 << self.castle_cell
+        coord_map = self.rules.coord_map
+        neighbor_mask = self.rules.neighbor_mask
+        return bool((neighbor_mask[coord_map[move.i, move.j]] | neighbor_mask[coord_map[move.i2, move.j2]])
+                    & castle_bit)
+
+    def _touches_terrain(self, c, partner, terrain_code):
+        for n in self.rules.cell_neighbors[c]:
+            if n != partner and self.terrain[n] == terrain_code:
+                return True
+        return False
+
+    def check_external_edge_formation(self, move):
+        """ See if the newly placed domino forms an edge with an existing tile. Castle adjacency doesn't count."""
+        coord_map = self.rules.coord_map
+        a = coord_map[move.i, move.j]
+        b = coord_map[move.i2, move.j2]
+        return (self._touches_terrain(a, b, TERRAIN_CODES[move.side_a.terrain]) or
+                self._touches_terrain(b, a, TERRAIN_CODES[move.side_b.terrain]))
+
+    def check_move_validity(self, move):
+        if abs(move.Di) + abs(move.Dj) != 1:
+            return False
+        # The width check comes first: it also guarantees both cells are on the grid.
+        if not self.check_if_grid_within_width_limits(move):
+            return False
+        coord_map = self.rules.coord_map
+        a = coord_map[move.i, move.j]
+        b = coord_map[move.i2, move.j2]
+        return self._placement_valid(a, b, TERRAIN_CODES[move.side_a.terrain], TERRAIN_CODES[move.side_b.terrain])
+
+    def _placement_valid(self, a, b, ta, tb):
+        """ Validity of side codes ta at cell a and tb at cell b, assuming the width limit already holds."""
+        if (self.occupied >> a) & 1 or (self.occupied >> b) & 1:
+            return False
+        neighbor_mask = self.rules.neighbor_mask
+        if (neighbor_mask[a] | neighbor_mask[b]) & (1 << self.castle_cell):
+            return True
+        return self._touches_terrain(a, b, ta) or self._touches_terrain(b, a, tb)
+
+    def get_feasible_move_set(self, domino):
+        """ Returns all moves that are valid, given self and domino."""
+        return {self.rules.placement_move(domino, code) for code in self.feasible_codes(domino)}
+
+    def feasible_codes(self, domino):
+        """ Move codes (see encode_move) of every valid placement of domino, in a fixed order. See
+        Rules.feasible_placements."""
+        assert isinstance(domino, Domino), 'Please pass a king domino "Domino" object.'
+        rules = self.rules
+        castle_mask = self.adjacency[TERRAIN_CODES['castle']]
+        adj_a = self.adjacency[domino.one_side.code & TERRAIN_MASK] | castle_mask
+        adj_b = self.adjacency[domino.other_side.code & TERRAIN_MASK] | castle_mask
+        base = domino.number * rules.n_slots
+        return [(base + slot) * 2 for slot in rules.feasible_placements(self.frontier, self.open_cells(), adj_a, adj_b)]
+
+    def open_cells(self):
+        """ Bitmask of empty cells a new side could take without breaking the maxwidth limit."""
+        return self.rules.window_mask(self.iMin, self.iMax, self.jMin, self.jMax) & ~self.occupied
+
+    def score_kings(self):
+        """ Current score, kept up to date as cells are set."""
+        return self.score
+
+    final_score = Board.final_score
+
+    def regions(self):
+        """ (size, crowns) of every connected terrain region."""
+        return [(self.region_size[c], self.region_kings[c]) for c in range(len(self.region)) if self.region[c] == c + 1]
+
+    score_delta = Board.score_delta
+    placement_gain = Board.placement_gain
+    score_deltas = Board.score_deltas
+    merged_gain = Board.merged_gain
+
+    def adjacent_regions(self, c, terrain_code):
+        """ Roots of the regions of that terrain next to cell c."""
+        roots = set()
+        region = self.region
+        terrain = self.terrain
+        for n in self.rules.cell_neighbors[c]:
+            if region[n] and terrain[n] == terrain_code:
+                roots.add(region[n] - 1)
+        return roots
+
+
+def decode_board(cells, rules=STANDARD):
+    """ BitBoard holding the kingdom written by Board.encode or BitBoard.encode under the same rules."""
+    assert len(cells) == rules.n_cells, 'Encoded board does not fit the grid of %r.' % rules
+    board = BitBoard(rules)
+    for c, code in enumerate(cells):
+        if code and c != board.castle_cell:
+            board._set_cell(c, code & TERRAIN_MASK, code >> CROWN_SHIFT)
+            i, j = rules.cell_coords[c]
+            board.iMax, board.iMin = max(board.iMax, i), min(board.iMin, i)
+            board.jMax, board.jMin = max(board.jMax, j), min(board.jMin, j)
+    return board
+
+
+def render_cells(cells, rules=STANDARD):
+    """ Text grid of an encoded kingdom (see Board.encode): terrain and crowns per cell, '.' where empty."""
+    rows = []
+    for i in rules.span:
+        row = []
+        for j in rules.span:
+            code = cells[rules.coord_map[i, j]]
+            if code:
+                row.append('%-9s %d' % (TERRAINS[(code & TERRAIN_MASK) - 1], code >> CROWN_SHIFT))
+            else:
+                row.append('%-9s  ' % '.')
+        rows.append(' | '.join(row))
+    return '\n'.join(rows)
+
+
+# Move codes on the standard grid; boards of other rules code moves with board.rules.encode_move etc.
+encode_move = STANDARD.encode_move
+placement_move = STANDARD.placement_move
+decode_move = STANDARD.decode_move
+
+
+def domino_mask(dominos):
+    """ Bitmask of domino numbers."""
+    mask = 0
+    for d in dominos:
+        mask |= 1 << d.number
+    return mask
+
+
+def random_playout(board, dominos, policy=None):
+    """ Draw dominos in random order and place each at a random feasible spot, discarding it if there is none, until
+    the deck runs out or the kingdom is full. Returns the final score; the board is restored before returning.
+    A rollout policy (see rollout.py) picks the spot instead, if given. The score includes the bonus points of the
+    board's rules (see Board.final_score)."""
+    place = board.rules.placement_move
+    n_pushed = 0
+    try:
+        for domino in random.sample(tuple(dominos), len(dominos)):
+            if board.is_full():
+                break
+            codes = board.feasible_codes(domino)
+            if codes:
+                code = random.choice(codes) if policy is None else policy.choose(board, domino, codes)
+                board.push(place(domino, code))
+                n_pushed += 1
+        return board.final_score()
+    finally:
+        for _ in range(n_pushed):
+            board.pop()
+
+
+class SearchSnapshot(object):
+    """ Best-so-far answer of MonteCarloKingDominoThinker.search. confidence estimates the probability that
+    best_move's position really is better than the runner-up's (normal approximation); it is 1 with a single
+    candidate position and 0.5 until both have two playouts."""
+
+    def __init__(self, best_move, value, confidence, playouts, elapsed):
+        self.best_move = best_move
+        self.value = value  # mean playout score after best_move
+        self.confidence = confidence
+        self.playouts = playouts
+        self.elapsed = elapsed
+
+    def __repr__(self):
+        return '%r value=%.2f confidence=%.3f playouts=%d (%.2fs)' % (self.best_move, self.value, self.confidence,
+                                                                       self.playouts, self.elapsed)
+
+    @staticmethod
+    def from_stats(groups, stats, started):
+        """ Snapshot from {position key: moves} and {position key: [score sum, sum of squares, playouts]}."""
+        ranked = sorted((float(total) / k, total, total_sq, k, key) for key, (total, total_sq, k) in stats.items() if k)
+        playouts = sum(s[2] for s in stats.values())
+        if not ranked:
+            return SearchSnapshot(None, 0.0, 0.0, 0, time.time() - started)
+        mean, total, total_sq, k, key = ranked[-1]
+        confidence = 1.0 if len(groups) == 1 else 0.5
+        if len(ranked) > 1 and k > 1 and ranked[-2][3] > 1:
+            variance = 0.0
+            for m, t, sq, n, _ in (ranked[-1], ranked[-2]):
+                variance += max(0.0, (sq - n * m * m) / (n - 1)) / n
+            if variance > 0:
+                confidence = 0.5 * (1 + math.erf((mean - ranked[-2][0]) / math.sqrt(2 * variance)))
+            else:
+                confidence = 1.0 if mean > ranked[-2][0] else 0.5
+        return SearchSnapshot(groups[key][0], mean, confidence, playouts, time.time() - started)
+
+
 class MonteCarloKingDominoThinker(object):
 
-    def __init__(self, board, remaining_dominos, think_time=10):
-        assert isinstance(board, Board)
+    def __init__(self, board, remaining_dominos, think_time=10, batch_size=None, pool=None, n_processes=None,
+                 memory_entries=100000, start_method=None, rollout_policy=None, book=None, endgame=None,
+                 allocation='even', separation=0.99):
+        assert isinstance(board, (Board, BitBoard))
         self.board = board
         self.remaining_dominos = remaining_dominos
         self.think_time = think_time  # seconds per move
-        self.n_processes = 16
-        self.short_term_memory = {}
-
-    def single_playout(self, board):
-        """ Make random moves to finish game and then return score."""
-        bc = copy.deepcopy(board)
-        next_domino = random.sample(self.remaining_dominos, k=1)[0]
-        feasible_moves = board.get_feasible_move_set(next_domino)
-        if len(feasible_moves) > 0:
-            next_mv = random.sample(feasible_moves, k=1)[0]
-            board.assign_domino(next_mv)
-
-        return board.score_kings()
-
-    def think_about_a_move(self, mv, thinking_time):
-        """ Make a move and then take average of random playouts from that point."""
-        bc = copy.deepcopy(self.board)
-        bc.assign_domino(mv)
-        time_allows = True
-        k = 0
-        score = 0
-        now = time.time()
-        while (time.time() - now) < 1:
-            score += self.single_playout(bc)
-            k += 1
-
-        avg_score = float(score) / k
-        return mv, avg_score
+        self.batch_size = batch_size  # if set, playouts are run this many at a time by batch_playout
+        self.rollout_policy = rollout_policy  # see rollout.py; None places uniformly at random
+        self.book = book  # opening_book.OpeningBook consulted before searching, or None
+        self.endgame = endgame  # endgame.EndgameSolver used instead of playouts once few enough dominoes remain
+        # 'even' splits think_time evenly over the candidate positions; 'halving' spends it in successive halving
+        # rounds, stopping early once the leader's confidence (see SearchSnapshot) reaches separation.
+        assert allocation in ('even', 'halving'), 'allocation must be even or halving.'
+        self.allocation = allocation
+        self.separation = separation
+        assert not (batch_size and rollout_policy), 'Batch playouts only place uniformly at random.'
+        self.n_processes = n_processes  # worker count for a pool started by the thinker; default cpu_count()
+        self.start_method = start_method  # multiprocessing start method for that pool, e.g. 'forkserver'
+        self.pool = pool  # worker_pool.PlayoutPool; pass one in to share it across turns
+        self.owns_pool = False
+        self.last_stats = {}  # move -> (score sum, playout count) from the last think_about_set_of_moves
+        # (score sum, playout count) per resulting position, keyed by canonical hash and remaining dominoes, so
+        # symmetric moves share playouts and statistics carry over between turns.
+        self.short_term_memory = TranspositionTable(max_entries=memory_entries)
+
+    def single_playout(self, board, dominos=None):
+        """ Make random moves to finish game and then return score. The board is left as it was found."""
+        return random_playout(board, self.remaining_dominos if dominos is None else dominos, self.rollout_policy)
 
     def think_about_set_of_moves(self, feasible_set):
+        started = time.time()
         n = len(feasible_set)
         print('number of feasible moves: %d' % n)
-        thinking_time_per_move = self.think_time / float(n)
-        f = partial(self.think_about_a_move, thinking_time=thinking_time_per_move)
-        with Pool(cpu_count()) as p:
-            out = dict(p.map(f, feasible_set))
-        return out
+
+        entry = self.book_entry(feasible_set)
+        if entry is not None:
+            self.last_stats = {entry.move: (entry.value * entry.playouts, entry.playouts)}
+            return {entry.move: entry.value}
+        if self.endgame is not None and self.endgame.applies(self.remaining_dominos):
+            values = self.endgame.move_values(self.board, feasible_set, self.remaining_dominos)
+            self.last_stats = {mv: (value, 1) for mv, value in values.items()}  # exact, so weighted as one playout
+            return values
+
+        groups = self._group_moves(feasible_set)
+        self._start_pool()
+        representatives = {self.board.rules.encode_move(mvs[0]): key for key, mvs in groups.items()}
+        if self.allocation == 'halving':
+            dispatched = time.time()
+            stats, results = self._successive_halving(groups, representatives, started)
+        else:
+            thinking_time_per_move = self.think_time / float(len(groups))
+            stats = self.pool.evaluate(self.board, representatives, self.remaining_dominos, thinking_time_per_move,
+                                       self.batch_size, self.rollout_policy)
+            dispatched, results = self.pool.last_dispatch, self.pool.last_results
+        if instrumentation.ACTIVE is not None:
+            instrumentation.ACTIVE.record_turn(instrumentation.search_turn(n, self.think_time, started, dispatched,
+                                                                           results))
+        for code, (total, k) in stats.items():
+            key = representatives[code]
+            old_total, old_k = self.short_term_memory.get(key, (0, 0))
+            self.short_term_memory.put(key, (old_total + total, old_k + k))
+
+        self.last_stats = {}
+        for key, mvs in groups.items():
+            s = self.short_term_memory.get(key)
+            for mv in mvs:
+                self.last_stats[mv] = s
+        return {mv: float(total) / k for mv, (total, k) in self.last_stats.items()}
+
+    def _successive_halving(self, groups, representatives, started):
+        """ Spend think_time over ceil(log2(positions)) rounds of equal budget. Each round plays out every surviving
+        position equally, then keeps the better half by mean score, so the leaders get most of the playouts. Stops
+        once one position is left or the best is separated from the runner-up with confidence self.separation; the
+        rest of the budget is not spent. A round is cut into at least one task per pool process so the whole pool
+        works even when few positions survive. Returns ({move code: (score sum, playouts)}, worker results)."""
+        rounds = max(1, int(math.ceil(math.log(len(representatives), 2))))
+        sums = {code: [0, 0, 0] for code in representatives}  # score sum, sum of squared scores, playouts
+        survivors = sorted(representatives)
+        results = []
+        for r in range(rounds):
+            copies = max(1, -(-self.pool.n_processes // len(survivors)))
+            tasks = [code for code in survivors for _ in range(copies)]
+            self.pool.evaluate(self.board, tasks, self.remaining_dominos, self.think_time / rounds / len(tasks),
+                               self.batch_size, self.rollout_policy)
+            for result in self.pool.last_results:
+                s = sums[result[0]]
+                s[0] += result[1]
+                s[1] += result[2]
+                s[2] += result[3]
+            results.extend(self.pool.last_results)
+            if len(survivors) == 1:
+                break
+            survivors.sort(key=lambda code: -float(sums[code][0]) / sums[code][2])
+            snapshot = SearchSnapshot.from_stats({code: groups[representatives[code]] for code in survivors},
+                                                 {code: sums[code] for code in survivors}, started)
+            if snapshot.confidence >= self.separation:
+                break
+            survivors = survivors[:(len(survivors) + 1) // 2]
+        return {code: (s[0], s[2]) for code, s in sums.items()}, results
+
+    def book_entry(self, feasible_set):
+        """ The opening book's entry for this position, if there is a book, the board plays the standard rules the
+        book was built for, feasible_set places a single domino and the book move is one of them."""
+        if (self.book is None or self.board.rules is not STANDARD or not feasible_set or
+                len({mv.domino.number for mv in feasible_set}) != 1):
+            return None
+        entry = self.book.lookup(self.board, next(iter(feasible_set)).domino)
+        if entry is None or entry.move not in feasible_set:
+            return None
+        return entry
+
+    def _group_moves(self, feasible_set):
+        """ {position key: moves}. Moves leading to the same position up to symmetry are played out once, through one
+        representative, and share statistics in short_term_memory."""
+        remaining_mask = domino_mask(self.remaining_dominos)
+        groups = {}
+        for mv in feasible_set:
+            with self.board.placed(mv):
+                key = ('stats', self.board.canonical_hash(), remaining_mask & ~(1 << mv.domino.number))
+            groups.setdefault(key, []).append(mv)
+        return groups
+
+    def _start_pool(self):
+        if self.pool is None:
+            from worker_pool import PlayoutPool
+            self.pool = PlayoutPool(self.n_processes, self.start_method)
+            self.owns_pool = True
+
+    async def search(self, feasible_set, deadline=None, slice_time=0.05, interval=0.1):
+        """ Anytime search, as an async generator of SearchSnapshots.
+
+        Every position reachable through feasible_set is played out on the worker pool in slices of slice_time
+        seconds, round after round, until deadline (a time.time() value, by default think_time from now) passes or the
+        consumer stops iterating or is cancelled. A snapshot is yielded whenever the best move changes or interval
+        seconds have gone by, and a last one when the deadline is reached. No slice is started that would end after the
+        deadline; slices still running when the search is stopped early end on their own within slice_time and their
+        results are dropped. Close the generator (contextlib.aclosing) to stop it promptly; the playouts done are then
+        added to short_term_memory.
+        """
+        import asyncio
+        started = time.time()
+        if deadline is None:
+            deadline = started + self.think_time
+        groups = self._group_moves(feasible_set)
+        self._start_pool()
+
+        loop = asyncio.get_running_loop()
+        results = asyncio.Queue()
+        running = [True]
+
+        def deliver(result):
+            if running[0]:
+                try:
+                    loop.call_soon_threadsafe(results.put_nowait, result)
+                except RuntimeError:
+                    pass  # the event loop is already closed
+
+        board_code = self.board.encode()
+        remaining_mask = domino_mask(self.remaining_dominos)
+        codes = {key: self.board.rules.encode_move(mvs[0]) for key, mvs in groups.items()}
+        keys = {code: key for key, code in codes.items()}
+        stats = {key: [0, 0, 0] for key in groups}  # score sum, sum of squared scores, playouts
+        in_flight = 0
+
+        def dispatch(key):
+            self.pool.submit(board_code, codes[key], remaining_mask, slice_time, self.batch_size, self.rollout_policy,
+                             self.board.rules, deliver)
+
+        getter = None
+        try:
+            for key in groups:
+                if time.time() + slice_time < deadline:
+                    dispatch(key)
+                    in_flight += 1
+            best_move = None
+            last_yield = started
+            while in_flight:
+                # asyncio.wait, unlike wait_for, never loses a cancellation that races with a result
+                getter = asyncio.ensure_future(results.get())
+                done, pending = await asyncio.wait((getter,), timeout=max(0.0, deadline - time.time()))
+                if not done:
+                    break
+                result = getter.result()
+                getter = None
+                in_flight -= 1
+                if isinstance(result, BaseException):
+                    raise result
+                code, total, total_sq, k = result[:4]
+                key = keys[code]
+                stats[key][0] += total
+                stats[key][1] += total_sq
+                stats[key][2] += k
+                if time.time() + slice_time < deadline:
+                    dispatch(key)
+                    in_flight += 1
+                snapshot = SearchSnapshot.from_stats(groups, stats, started)
+                if snapshot.best_move is not best_move or time.time() - last_yield >= interval:
+                    best_move = snapshot.best_move
+                    last_yield = time.time()
+                    yield snapshot
+            yield SearchSnapshot.from_stats(groups, stats, started)
+        finally:
+            running[0] = False
+            if getter is not None:
+                getter.cancel()
+            for key, (total, total_sq, k) in stats.items():
+                if k:
+                    old_total, old_k = self.short_term_memory.get(key, (0, 0))
+                    self.short_term_memory.put(key, (old_total + total, old_k + k))
+
+    def close(self):
+        """ Stop the worker pool if this thinker started it."""
+        if self.owns_pool:
+            self.pool.close()
+            self.pool = None
+            self.owns_pool = False
 
 
 if __name__ == '__main__':
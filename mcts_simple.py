@@ -1,43 +1,41 @@
-import pandas as pd
 import random
+import sys
+
 import kingDomino as kD
 from domino_library import DOMINO_LIB
+from uct import UCTKingDominoThinker
+from game_log import GameLogWriter
 
 if __name__ == '__main__':
+    # The game is appended to the log at the path given, by default mcts_simple.kdlog.
+    log_path = sys.argv[1] if len(sys.argv) > 1 else 'mcts_simple.kdlog'
     myBoard = kD.Board()
 
     # Place some moves first
     N = 0
+    moves = []
     # random.seed(0)
-    dom_set = set(DOMINO_LIB)
     doms = random.sample(DOMINO_LIB, len(DOMINO_LIB))
     for dom in doms[:N]:
         feasible_set = myBoard.get_feasible_move_set(dom)
-        mv = random.sample(feasible_set, 1)[0]
+        mv = random.choice(tuple(feasible_set))
         myBoard.assign_domino(mv)
+        moves.append(mv)
 
-    moves_left = True
-    doms_left = set(doms[N:])
-    while moves_left:
-
-        total_feasible_set = set()
-        for dom in doms_left:
-            total_feasible_set = total_feasible_set.union(myBoard.get_feasible_move_set(dom))
-        if len(total_feasible_set) == 0:
-            moves_left = False
-        else:
-            tree = kD.MonteCarloKingDominoThinker(myBoard, doms_left, think_time=100)
-            out = tree.think_about_set_of_moves(total_feasible_set)
-            max_score = -1
-            best_move = None
+    # Free choice: any remaining domino may be placed next. The search tree is kept from one move to the next.
+    tree = UCTKingDominoThinker(myBoard, doms[N:], think_time=100, free_choice=True)
+    while True:
+        best_move = tree.choose_move()
+        if best_move is None:
+            break
+        print('number of feasible moves: %d, playouts so far: %d' % (len(tree.root.moves), tree.playouts))
+        max_score = tree.root.value(best_move)
+        tree.advance(best_move)
+        moves.append(best_move)
 
-            for mv, score in out.items():
-                if score > max_score:
-                    best_move = mv
-                    max_score = score
-            myBoard.assign_domino(best_move)
-            doms_left.remove(best_move.domino)
+        print(best_move, max_score)
+        myBoard.show()
+        print(myBoard.score_kings())
 
-            print(best_move, max_score)
-            myBoard.show()
-            print(myBoard.score_kings())
+    with GameLogWriter(log_path) as log:
+        log.write_moves(moves, myBoard.score_kings())
@@ -0,0 +1,189 @@
+"""
+Opening book: best first placements, searched offline and looked up in microseconds.
+
+Entries are keyed by the canonical hash of the kingdom (see Board.canonical_hash) and the domino number, so one entry
+serves all eight rotations and reflections of a position. The placement is stored in the canonical frame and mapped
+back onto the board being looked up. Values assume solitaire play with every other library domino still to come.
+
+The file is a sorted array of fixed-size records behind a short header, memory-mapped read-only, so every process
+that opens the same book shares one copy of it in the page cache:
+
+    header: MAGIC, then the record count as uint32
+    record: canonical hash (uint64), domino number, side_a cell, side_b cell, first_side (uint8 each),
+            mean score (float32), playouts (uint32)
+
+    python opening_book.py book.bin --depth 1 --think-time 2    # build
+"""
+import argparse
+from contextlib import nullcontext
+import copy
+import mmap
+import struct
+import time
+
+from kingDomino import (Board, Move, CELL_COORDS, COORD_MAP, N_CELLS, SYMMETRY_CELLS, MonteCarloKingDominoThinker,
+                        encode_move, placement_move)
+from domino_library import DOMINO_LIB
+from branch_and_bound import domino_kind
+
+MAGIC = b'KDBOOK1\0'
+HEADER = struct.Struct('<8sI')
+RECORD = struct.Struct('<QBBBBfI')
+
+# INVERSE_CELLS[s][c]: the cell that symmetry s takes to c
+INVERSE_CELLS = []
+for cells in SYMMETRY_CELLS:
+    inverse = [0] * N_CELLS
+    for c, image in enumerate(cells):
+        inverse[image] = c
+    INVERSE_CELLS.append(inverse)
+
+
+class BookEntry(object):
+
+    def __init__(self, move, value, playouts):
+        self.move = move
+        self.value = value
+        self.playouts = playouts
+
+    def __repr__(self):
+        return '%rvalue=%.2f playouts=%d' % (self.move, self.value, self.playouts)
+
+
+def canonical_record(board, move, value, playouts):
+    """ Record tuple for move on board, with the placement written in the board's canonical frame."""
+    cells = SYMMETRY_CELLS[board.canonical_symmetry()]
+    return (board.canonical_hash(), move.domino.number, cells[COORD_MAP[move.i, move.j]],
+            cells[COORD_MAP[move.i2, move.j2]], move.first_side, value, playouts)
+
+
+def write_book(path, records):
+    """ Write records (see canonical_record) to path as a book. Later records replace earlier ones with the same
+    key."""
+    unique = {}
+    for record in records:
+        unique[record[:2]] = record
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, len(unique)))
+        for key in sorted(unique):
+            f.write(RECORD.pack(*unique[key]))
+
+
+class OpeningBook(object):
+    """ Read-only view of a book file. Use as a context manager or call close()."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.n_records = HEADER.unpack_from(self.data, 0)
+        assert magic == MAGIC, 'Not an opening book: %s' % path
+        assert len(self.data) == HEADER.size + self.n_records * RECORD.size, 'Truncated opening book: %s' % path
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return self.n_records
+
+    def _record(self, n):
+        return RECORD.unpack_from(self.data, HEADER.size + n * RECORD.size)
+
+    def lookup(self, board, domino):
+        """ BookEntry with the best placement of domino on board, or None if the position is not in the book."""
+        key = (board.canonical_hash(), domino.number)
+        lo = 0
+        hi = self.n_records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._record(mid)[:2] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.n_records or self._record(lo)[:2] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        h, number, a, b, first_side, value, playouts = self._record(lo)
+        if first_side:
+            a, b = b, a  # written the way get_feasible_move_set does, with domino[0] as side_a
+        inverse = INVERSE_CELLS[board.canonical_symmetry()]
+        i, j = CELL_COORDS[inverse[a]]
+        i2, j2 = CELL_COORDS[inverse[b]]
+        return BookEntry(Move(domino, 0, i, j, i2 - i, j2 - j), value, playouts)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def book_positions(depth, dominos=DOMINO_LIB):
+    """ (board, numbers of the dominoes on it) for every position reached with fewer than depth placements from the
+    castle, one per canonical position."""
+    level = [(Board(), frozenset())]
+    for ply in range(depth):
+        for position in level:
+            yield position
+        if ply + 1 == depth:
+            break
+        following = {}
+        for board, placed in level:
+            for d in dominos:
+                if d.number in placed:
+                    continue
+                for code in board.feasible_codes(d):
+                    with board.placed(placement_move(d, code)):
+                        key = (board.canonical_hash(), placed | {d.number})
+                        if key not in following:
+                            child = copy.deepcopy(board)
+                            child.undo_stack = []
+                            following[key] = (child, key[1])
+        level = list(following.values())
+
+
+def build_book(path, depth=1, think_time=1.0, n_processes=None, dominos=DOMINO_LIB, verbose=True, pool=None):
+    """ Search every domino in every book position with MonteCarloKingDominoThinker for think_time seconds and write
+    the best placements to path. Dominoes with the same two sides are searched once. Searches run on pool (a
+    PlayoutPool or playout_farm.FarmCoordinator, left open) or else on a PlayoutPool of n_processes."""
+    from worker_pool import PlayoutPool
+    records = []
+    start = time.time()
+    with (PlayoutPool(n_processes) if pool is None else nullcontext(pool)) as pool:
+        for board, placed in book_positions(depth, dominos):
+            searched = {}  # domino kind -> (best move, value, playouts)
+            for d in dominos:
+                if d.number in placed:
+                    continue
+                kind = domino_kind(d)
+                if kind not in searched:
+                    moves = board.get_feasible_move_set(d)
+                    if not moves:
+                        continue
+                    remaining = [o for o in dominos if o.number != d.number and o.number not in placed]
+                    thinker = MonteCarloKingDominoThinker(board, remaining, think_time=think_time, pool=pool)
+                    values = thinker.think_about_set_of_moves(moves)
+                    best = max(sorted(values, key=encode_move), key=values.get)
+                    searched[kind] = (best, values[best], thinker.last_stats[best][1])
+                best, value, playouts = searched[kind]
+                first_side = best.first_side
+                if d.one_side is not best.domino.one_side:
+                    first_side = 1 - first_side  # same kind, sides listed the other way round
+                move = Move(d, first_side, best.i, best.j, best.Di, best.Dj)
+                records.append(canonical_record(board, move, value, playouts))
+            if verbose:
+                print('%d records (%.0fs)' % (len(records), time.time() - start))
+    write_book(path, records)
+    return len(records)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a KingDomino opening book.')
+    parser.add_argument('path')
+    parser.add_argument('--depth', type=int, default=1, help='book positions have fewer than this many placements')
+    parser.add_argument('--think-time', type=float, default=1.0, help='seconds of search per position and domino')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    print('%d records written' % build_book(args.path, args.depth, args.think_time, args.processes))
@@ -0,0 +1,333 @@
+"""
+Playout farm: worker_pool tasks spread over machines through one TCP coordinator.
+
+The coordinator lives in the searching process and has PlayoutPool's evaluate/submit interface, so it can be passed
+to MonteCarloKingDominoThinker(pool=...) or anything else taking a pool. Workers connect to it, say how many playout
+processes they run and receive work units: worker_pool tasks of an encoded board, a move code, a remaining-domino
+mask, a playout budget in seconds and the board's rules. Each worker evaluates units on its own PlayoutPool and sends
+back the evaluate_move results, which the coordinator hands to the caller.
+
+Workers send a heartbeat every HEARTBEAT_INTERVAL seconds. A worker that disconnects or stays silent for
+heartbeat_timeout seconds is dropped and its unfinished units are dispatched again to the others (a silent worker
+that speaks again is taken back); a late result for a unit that was already answered is ignored. report() gives
+units, playouts and playouts per second per worker.
+
+Connections are authenticated with a shared key (multiprocessing.connection), since messages are pickled:
+
+    coordinator = FarmCoordinator(('0.0.0.0', 7070), authkey=b'secret')       # searching process
+    python playout_farm.py host:7070 --authkey secret --processes 16          # each worker machine
+
+start_local_workers runs workers as local processes, for tests and single-machine use.
+"""
+import argparse
+from collections import deque
+from itertools import count
+from multiprocessing import AuthenticationError, Process
+from multiprocessing.connection import Client, Listener
+import os
+import socket
+import threading
+import time
+
+from kingDomino import STANDARD, domino_mask
+from worker_pool import PlayoutPool
+
+HEARTBEAT_INTERVAL = 1.0  # seconds between worker heartbeats
+HEARTBEAT_TIMEOUT = 5.0  # seconds of silence after which the coordinator drops a worker
+
+
+class FarmWorker(object):
+    """ Coordinator-side record of one connected worker."""
+
+    def __init__(self, conn, name, capacity):
+        self.conn = conn
+        self.name = name
+        self.capacity = capacity  # units it runs at once: its playout process count
+        self.in_flight = {}  # unit id -> time sent
+        self.last_seen = time.time()
+        self.alive = True
+        self.units = 0
+        self.playouts = 0
+        self.seconds = 0.0  # process time spent on playouts, summed over the worker's processes
+
+    def __repr__(self):
+        return '%s: %d units, %d playouts%s' % (self.name, self.units, self.playouts, '' if self.alive else ' (lost)')
+
+
+class FarmCoordinator(object):
+    """ Accepts workers and dispatches units to them. Use as a context manager or call close()."""
+
+    def __init__(self, address=('127.0.0.1', 0), authkey=None, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.authkey = authkey or os.urandom(32)
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address  # (host, port) actually bound, e.g. when the port was 0
+        self.heartbeat_timeout = heartbeat_timeout
+        self.lock = threading.Condition()
+        self.workers = []
+        self.units = {}  # unit id -> (task, callback), until answered
+        self.waiting = deque()  # unit ids not on any worker
+        self.unit_ids = count()
+        self.redispatched = 0
+        self.lost_workers = 0
+        self.started = time.time()
+        self.closed = False
+        self.last_dispatch = None  # PlayoutPool compatibility, see PlayoutPool.evaluate
+        self.last_results = []
+        for target in (self._accept, self._monitor):
+            threading.Thread(target=target, daemon=True).start()
+
+    def wait_for_workers(self, n, timeout=None):
+        """ Block until n workers are connected; returns whether they are."""
+        with self.lock:
+            return self.lock.wait_for(lambda: self.n_workers() >= n, timeout)
+
+    def n_workers(self):
+        return sum(1 for w in self.workers if w.alive)
+
+    @property
+    def n_processes(self):
+        """ Playout processes over the connected workers, as PlayoutPool.n_processes."""
+        return sum(w.capacity for w in self.workers if w.alive) or 1
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                conn = self.listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue  # a client with the wrong key, or the listener closing
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        """ Read one worker's messages until it goes away."""
+        try:
+            hello = conn.recv()
+        except (OSError, EOFError):
+            conn.close()
+            return
+        if not (isinstance(hello, tuple) and len(hello) == 3 and hello[0] == 'hello'):
+            conn.close()  # not a worker
+            return
+        kind, name, capacity = hello
+        worker = FarmWorker(conn, name, capacity)
+        with self.lock:
+            if self.closed:
+                conn.close()
+                return
+            self.workers.append(worker)
+            self._dispatch()
+            self.lock.notify_all()
+        try:
+            while True:
+                message = conn.recv()
+                worker.last_seen = time.time()
+                if not worker.alive:
+                    with self.lock:
+                        worker.alive = True  # dropped for silence, but back
+                        self._dispatch()
+                if message[0] != 'heartbeat':
+                    self._answer(worker, *message)
+        except (OSError, EOFError):
+            pass
+        finally:
+            with self.lock:
+                self._drop(worker)
+                self._dispatch()
+            conn.close()
+
+    def _answer(self, worker, kind, unit_id, result):
+        with self.lock:
+            worker.in_flight.pop(unit_id, None)
+            unit = self.units.pop(unit_id, None)
+            if kind == 'result':
+                worker.units += 1
+                worker.playouts += result[3]
+                worker.seconds += result[6]
+            self._dispatch()
+        if unit is not None:  # else answered already, by a worker it was dispatched to before
+            unit[1](result)
+
+    def _requeue(self, worker, unit_id):
+        """ Take unit_id off worker and put it at the front of the queue if it is still unanswered. Call with the lock
+        held."""
+        del worker.in_flight[unit_id]
+        if unit_id in self.units:
+            self.waiting.appendleft(unit_id)
+            self.redispatched += 1
+
+    def _drop(self, worker):
+        """ Stop dispatching to worker and requeue its unfinished units. Call with the lock held; the connection is
+        closed by the thread reading it."""
+        if not worker.alive:
+            return
+        worker.alive = False
+        self.lost_workers += 1
+        for unit_id in sorted(worker.in_flight, reverse=True):
+            self._requeue(worker, unit_id)
+
+    def _monitor(self):
+        """ Drop workers that stopped sending heartbeats, and dispatch again units held far longer than their
+        budget by workers that did not."""
+        while not self.closed:
+            time.sleep(min(HEARTBEAT_INTERVAL, self.heartbeat_timeout / 2))
+            now = time.time()
+            with self.lock:
+                for worker in self.workers:
+                    if not worker.alive:
+                        continue
+                    if now - worker.last_seen > self.heartbeat_timeout:
+                        self._drop(worker)
+                        continue
+                    for unit_id, sent in list(worker.in_flight.items()):
+                        task = self.units.get(unit_id, (None,))[0]
+                        if task is None or now - sent > task[3] + self.heartbeat_timeout:
+                            self._requeue(worker, unit_id)
+                self._dispatch()
+
+    def _dispatch(self):
+        """ Send waiting units to the workers with the most free capacity. Call with the lock held."""
+        while self.waiting:
+            free = [w for w in self.workers if w.alive and len(w.in_flight) < w.capacity]
+            if not free:
+                return
+            worker = min(free, key=lambda w: len(w.in_flight) / float(w.capacity))
+            unit_id = self.waiting.popleft()
+            if unit_id not in self.units:
+                continue
+            worker.in_flight[unit_id] = time.time()
+            try:
+                worker.conn.send(('unit', unit_id, self.units[unit_id][0]))
+            except OSError:
+                self._drop(worker)
+
+    def submit(self, board_code, move_code, remaining_mask, think_time, batch_size=None, policy=None, rules=STANDARD,
+               callback=None):
+        """ Queue one unit; callback gets its evaluate_move result, or the exception raised evaluating it, from a
+        coordinator thread. Units wait while no worker is connected. rules are those board_code was encoded under."""
+        task = (board_code, move_code, remaining_mask, think_time, batch_size, policy, rules)
+        with self.lock:
+            unit_id = next(self.unit_ids)
+            self.units[unit_id] = (task, callback or (lambda result: None))
+            self.waiting.append(unit_id)
+            self._dispatch()
+        return unit_id
+
+    def evaluate(self, board, moves, remaining_dominos, think_time, batch_size=None, policy=None):
+        """ {move code: (score sum, playout count)} for each of moves, as PlayoutPool.evaluate."""
+        board_code = board.encode()
+        remaining_mask = domino_mask(remaining_dominos)
+        results = []
+        done = threading.Condition()
+
+        def collect(result):
+            with done:
+                results.append(result)
+                done.notify()
+
+        self.last_dispatch = time.time()
+        for code in moves:
+            self.submit(board_code, code, remaining_mask, think_time, batch_size, policy, board.rules, collect)
+        with done:
+            done.wait_for(lambda: len(results) == len(moves))
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        self.last_results = results
+        return {result[0]: (result[1], result[3]) for result in results}
+
+    def throughput(self):
+        """ {worker name: (units, playouts, playouts per second of process time)}."""
+        with self.lock:
+            return {w.name: (w.units, w.playouts, w.playouts / max(w.seconds, 1e-9)) for w in self.workers}
+
+    def report(self):
+        """ Throughput per worker and overall since the coordinator started, as text."""
+        elapsed = time.time() - self.started
+        lines = []
+        total = 0
+        for name, (units, playouts, rate) in sorted(self.throughput().items()):
+            lines.append('%-30s %8d units %12d playouts %10.1f playouts/s' % (name, units, playouts, rate))
+            total += playouts
+        lines.append('%d workers (%d lost), %d units re-dispatched, %.1f playouts/s over %.1fs' % (
+            self.n_workers(), self.lost_workers, self.redispatched, total / max(elapsed, 1e-9), elapsed))
+        return '\n'.join(lines)
+
+    def close(self):
+        """ Tell connected workers to stop, then stop listening."""
+        with self.lock:
+            self.closed = True
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                worker.conn.send(('stop',))
+            except OSError:
+                pass
+        try:
+            Client(self.address, authkey=self.authkey).close()  # wake _accept so it sees closed
+        except OSError:
+            pass
+        self.listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_worker(address, authkey, n_processes=None, heartbeat_interval=HEARTBEAT_INTERVAL, name=None):
+    """ Serve units from the coordinator at address on a local PlayoutPool until it says stop or disconnects."""
+    conn = Client(tuple(address), authkey=authkey)
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+
+    def send(message):
+        try:
+            with send_lock:
+                conn.send(message)
+        except OSError:
+            stopped.set()
+
+    def heartbeat():
+        while not stopped.wait(heartbeat_interval):
+            send(('heartbeat',))
+
+    with PlayoutPool(n_processes) as pool:
+        send(('hello', name or '%s:%d' % (socket.gethostname(), os.getpid()), pool.n_processes))
+        threading.Thread(target=heartbeat, daemon=True).start()
+        try:
+            while not stopped.is_set():
+                message = conn.recv()
+                if message[0] == 'stop':
+                    break
+                kind, unit_id, task = message
+
+                def reply(result, unit_id=unit_id):
+                    send(('error' if isinstance(result, BaseException) else 'result', unit_id, result))
+
+                pool.submit(*task, callback=reply)
+        except (OSError, EOFError):
+            pass  # coordinator gone
+        finally:
+            stopped.set()
+            conn.close()
+
+
+def start_local_workers(address, authkey, n_workers, n_processes=1):
+    """ Start n_workers worker processes on this machine, each with n_processes playout processes; returns them."""
+    workers = []
+    for n in range(n_workers):
+        # not daemonic: each worker starts playout processes of its own
+        p = Process(target=run_worker, args=(address, authkey, n_processes), kwargs={'name': 'local-%d' % n})
+        p.start()
+        workers.append(p)
+    return workers
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a playout farm worker.')
+    parser.add_argument('address', help='coordinator host:port')
+    parser.add_argument('--authkey', required=True, help='key shared with the coordinator')
+    parser.add_argument('--processes', type=int, default=None, help='playout processes (default: cpu count)')
+    args = parser.parse_args()
+    host, port = args.address.rsplit(':', 1)
+    run_worker((host, int(port)), args.authkey.encode(), args.processes)
@@ -0,0 +1,50 @@
+"""
+Rollout policies for random_playout. Dominoes are still drawn at random; a policy only picks where each one goes.
+
+A policy has choose(board, domino, codes) -> one of codes, the feasible move codes from board.feasible_codes(domino).
+Policies are pickled into playout workers, so they hold parameters only.
+"""
+import random
+
+
+class HeuristicRollout(object):
+    """ Scores each placement as
+
+        score gain + openness_weight * (open cells next to the new sides) + merge_weight * (existing regions joined)
+
+    from the board's region bookkeeping (placement_gain) and its cell masks, without placing anything, and takes the
+    best, breaking ties at random. With probability epsilon it takes a uniformly random placement instead:
+    epsilon=0 is greedy and epsilon=1 is the plain random rollout."""
+
+    def __init__(self, epsilon=0.1, openness_weight=0.25, merge_weight=0.5, rng=None):
+        assert 0 <= epsilon <= 1, 'epsilon must be between 0 and 1.'
+        self.epsilon = epsilon
+        self.openness_weight = openness_weight
+        self.merge_weight = merge_weight
+        self.rng = rng  # a random.Random, or None for the random module
+
+    def choose(self, board, domino, codes):
+        rng = self.rng or random
+        if len(codes) == 1 or rng.random() < self.epsilon:
+            return rng.choice(codes)
+
+        open_cells = board.open_cells()
+        slot_cells = board.rules.slot_cells
+        n_slots = board.rules.n_slots
+        neighbor_mask = board.rules.neighbor_mask
+        sides = (domino.one_side, domino.other_side)
+        best = []
+        best_value = None
+        for code in codes:
+            a, b = slot_cells[(code >> 1) % n_slots]
+            side_a = sides[code & 1]
+            side_b = sides[1 - (code & 1)]
+            gain, joined = board.placement_gain(a, b, side_a, side_b)
+            free = (neighbor_mask[a] | neighbor_mask[b]) & open_cells & ~(1 << a | 1 << b)
+            value = gain + self.openness_weight * bin(free).count('1') + self.merge_weight * joined
+            if best_value is None or value > best_value:
+                best = [code]
+                best_value = value
+            elif value == best_value:
+                best.append(code)
+        return best[0] if len(best) == 1 else rng.choice(best)
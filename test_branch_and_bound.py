@@ -0,0 +1,62 @@
+"""
+branch_and_bound.solve claims an exact maximum: on decks small enough to enumerate, it must match a search over every
+subset and order of placements, and its moves must build a kingdom with that score. Run with
+python -m unittest test_branch_and_bound (or pytest).
+"""
+import random
+import unittest
+
+import branch_and_bound
+from domino_library import DOMINO_LIB
+from kingDomino import STANDARD, Board
+
+
+def exhaustive_best(board, dominos, seen):
+    """ Best score_kings() reachable from board placing any of dominos, in any order, by trying every feasible code."""
+    key = (bytes(board.encode()), tuple(d.number for d in dominos))
+    if key not in seen:
+        best = board.score_kings()
+        for index, domino in enumerate(dominos):
+            rest = dominos[:index] + dominos[index + 1:]
+            for code in board.feasible_codes(domino):
+                with board.placed(board.rules.placement_move(domino, code)):
+                    best = max(best, exhaustive_best(board, rest, seen))
+        seen[key] = best
+    return seen[key]
+
+
+class BranchAndBoundTest(unittest.TestCase):
+
+    def check_deck(self, board, deck):
+        before = bytes(board.encode())
+        expected = exhaustive_best(board, deck, {})
+        result = branch_and_bound.solve(board, deck)
+        self.assertTrue(result.proved, 'An unlimited search must be exhausted.')
+        self.assertEqual(bytes(board.encode()), before, 'solve() must leave the board it searched unchanged.')
+        self.assertEqual(result.score, expected, 'solve() missed the best kingdom.')
+
+        numbers = [mv.domino.number for mv in result.moves]
+        self.assertEqual(len(numbers), len(set(numbers)), 'A domino was placed twice.')
+        self.assertTrue(set(numbers) <= set(d.number for d in deck), 'A move places a domino not in the deck.')
+        for mv in result.moves:
+            self.assertTrue(board.push(mv), 'The move sequence is not playable in order.')
+        self.assertEqual(board.score_kings(), result.score, 'The moves do not build a kingdom with the claimed score.')
+        self.assertEqual(result.board.score_kings(), result.score)
+        for mv in result.moves:
+            board.pop()
+
+    def test_empty_kingdom(self):
+        for seed in range(3):
+            self.check_deck(Board(STANDARD), random.Random(seed).sample(DOMINO_LIB, 3))
+
+    def test_started_kingdom(self):
+        rng = random.Random(7)
+        board = Board(STANDARD)
+        dominos = rng.sample(DOMINO_LIB, 7)
+        for domino in dominos[:4]:
+            board.push(STANDARD.placement_move(domino, rng.choice(board.feasible_codes(domino))))
+        self.check_deck(board, dominos[4:])
+
+
+if __name__ == '__main__':
+    unittest.main()
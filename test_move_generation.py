@@ -0,0 +1,62 @@
+"""
+Move generation against a brute-force scan: run with python -m unittest test_move_generation (or pytest).
+"""
+import random
+import unittest
+
+from domino_library import DOMINO_LIB
+from kingDomino import ORIENTATIONS, STANDARD, BitBoard, Board, Move, Rules
+
+
+def placement(mv):
+    """ Cells and sides a Move covers; the same placement can be written with either side first."""
+    return frozenset([((mv.i, mv.j), mv.side_a), ((mv.i2, mv.j2), mv.side_b)])
+
+
+def scanned_placements(board, domino):
+    """ Every placement of domino check_move_validity accepts, trying every cell, orientation and side."""
+    rules = board.rules
+    found = set()
+    for i, j in rules.cell_coords:
+        for Di, Dj in ORIENTATIONS:
+            if (i + Di, j + Dj) not in rules.coord_map:
+                continue
+            for first_side in (0, 1):
+                mv = Move(domino, first_side, i, j, Di, Dj)
+                if board.check_move_validity(mv):
+                    found.add(placement(mv))
+    return found
+
+
+class MoveGenerationTest(unittest.TestCase):
+
+    def check_games(self, rules, seeds):
+        """ Play seeded random games on a Board and a BitBoard side by side, checking every domino drawn."""
+        for seed in seeds:
+            rng = random.Random(seed)
+            board = Board(rules)
+            bit_board = BitBoard(rules)
+            for domino in rng.sample(DOMINO_LIB, len(DOMINO_LIB)):
+                codes = board.feasible_codes(domino)
+                self.assertEqual(len(codes), len(set(codes)), 'Duplicate move codes.')
+                self.assertEqual(sorted(codes), sorted(bit_board.feasible_codes(domino)))
+                moves = [rules.placement_move(domino, code) for code in codes]
+                self.assertEqual({placement(mv) for mv in moves}, scanned_placements(board, domino))
+                self.assertEqual(set(board.get_feasible_move_set(domino)), set(moves))
+                if codes:
+                    mv = moves[rng.randrange(len(moves))]
+                    self.assertTrue(board.push(mv))
+                    self.assertTrue(bit_board.push(mv))
+                    self.assertEqual(board.encode(), bit_board.encode())
+                if board.is_full():
+                    break
+
+    def test_standard_grid(self):
+        self.check_games(STANDARD, range(4))
+
+    def test_mighty_duel_grid(self):
+        self.check_games(Rules(7), range(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""
+Localhost tests of the playout farm: run with python -m unittest test_playout_farm (or pytest).
+"""
+from multiprocessing.connection import Client
+import threading
+import time
+import unittest
+
+from domino_library import DOMINO_LIB
+from kingDomino import BitBoard
+from playout_farm import FarmCoordinator, start_local_workers
+
+
+class PlayoutFarmTest(unittest.TestCase):
+
+    def setUp(self):
+        self.coordinator = FarmCoordinator(heartbeat_timeout=2.0)
+        self.workers = []
+
+    def tearDown(self):
+        self.coordinator.close()
+        for p in self.workers:
+            p.join(10)
+            if p.is_alive():
+                p.kill()
+
+    def test_bad_hello_is_closed(self):
+        conn = Client(self.coordinator.address, authkey=self.coordinator.authkey)
+        conn.send(('not a hello',))
+        self.assertTrue(conn.poll(5), 'The coordinator kept the connection open.')
+        with self.assertRaises(EOFError):
+            conn.recv()  # the coordinator hung up
+        conn.close()
+        self.assertEqual(self.coordinator.n_workers(), 0)
+
+    def test_killed_worker_units_are_redispatched(self):
+        coordinator = self.coordinator
+        self.workers = start_local_workers(coordinator.address, coordinator.authkey, 2)
+        self.assertTrue(coordinator.wait_for_workers(2, timeout=30))
+        board = BitBoard()
+        codes = board.feasible_codes(DOMINO_LIB[0])[:6]
+
+        threading.Timer(0.3, self.workers[0].kill).start()  # while it holds a unit
+        started = time.time()
+        stats = coordinator.evaluate(board, codes, DOMINO_LIB[1:], think_time=0.5)
+
+        self.assertEqual(set(stats), set(codes))
+        self.assertTrue(all(playouts > 0 for total, playouts in stats.values()))
+        self.assertEqual(coordinator.n_workers(), 1)
+        self.assertGreaterEqual(coordinator.lost_workers, 1)
+        self.assertGreaterEqual(coordinator.redispatched, 1)
+        self.assertLess(time.time() - started, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
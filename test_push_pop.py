@@ -0,0 +1,58 @@
+"""
+Make/unmake: push and pop must restore a kingdom exactly, and score_deltas must predict what push scores. Run with
+python -m unittest test_push_pop (or pytest).
+"""
+import random
+import unittest
+
+from domino_library import DOMINO_LIB
+from kingDomino import STANDARD, BitBoard, Board, Rules
+
+PROBES = DOMINO_LIB[::6]  # dominoes whose feasible moves stand in for the frontier and masks
+
+
+def state(board):
+    """ Everything observable about a kingdom: cells, hashes, score and the moves open to a few dominoes."""
+    return (bytes(board.encode()), board.zobrist_hash(), board.canonical_hash(), board.score_kings(),
+            board.final_score(), board.is_full(), [sorted(board.feasible_codes(d)) for d in PROBES])
+
+
+class PushPopTest(unittest.TestCase):
+
+    def check_sequences(self, board_factory, rules, seeds):
+        for seed in seeds:
+            rng = random.Random(seed)
+            board = board_factory(rules)
+            states = []
+            for domino in rng.sample(DOMINO_LIB, len(DOMINO_LIB)):
+                codes = board.feasible_codes(domino)
+                if not codes:
+                    continue
+                before = state(board)
+                score = board.score_kings()
+                for code, delta in zip(codes, board.score_deltas(domino, codes)):
+                    mv = rules.placement_move(domino, code)
+                    with board.placed(mv):
+                        self.assertEqual(board.score_kings() - score, delta, 'score_deltas disagrees with push.')
+                    self.assertEqual(state(board), before, 'placed() did not restore the kingdom.')
+                states.append(before)
+                self.assertTrue(board.push(rules.placement_move(domino, rng.choice(codes))))
+            while states:
+                board.pop()
+                self.assertEqual(state(board), states.pop(), 'pop() did not restore the kingdom.')
+            self.assertEqual(state(board), state(board_factory(rules)))
+
+    def test_board(self):
+        self.check_sequences(Board, STANDARD, range(3))
+
+    def test_bit_board(self):
+        self.check_sequences(BitBoard, STANDARD, range(3))
+
+    def test_bonus_rules_on_the_mighty_duel_grid(self):
+        rules = Rules(7, middle_kingdom=True, harmony=True)
+        self.check_sequences(Board, rules, range(1))
+        self.check_sequences(BitBoard, rules, range(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
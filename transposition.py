@@ -0,0 +1,68 @@
+"""
+Bounded transposition table. Keys are usually built from Board.zobrist_hash() or Board.canonical_hash(); values are
+search statistics or searched-position marks. The least recently used entries are evicted once either the entry count
+or the approximate memory use goes over its cap.
+
+Feasible move sets and scores are not cached: boards score incrementally, and the searches rarely generate moves
+twice for the same kingdom and domino (about 2% of the branch-and-bound solver's calls), so a lookup costs more than
+it saves.
+"""
+from collections import OrderedDict
+import sys
+
+ENTRY_OVERHEAD = 100  # rough bytes per entry for the key and the OrderedDict links
+
+
+def approximate_size(value):
+    """ Bytes used by value, counting one level into containers."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        size += sum(sys.getsizeof(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(sys.getsizeof(k) + sys.getsizeof(v) for k, v in value.items())
+    return size
+
+
+class TranspositionTable(object):
+
+    def __init__(self, max_entries=100000, max_bytes=64 * 2 ** 20, sizeof=approximate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.entries = OrderedDict()  # key -> (value, size)
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value):
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.n_bytes -= old[1]
+        size = self.sizeof(value) + ENTRY_OVERHEAD
+        self.entries[key] = (value, size)
+        self.n_bytes += size
+        while len(self.entries) > self.max_entries or (self.n_bytes > self.max_bytes and len(self.entries) > 1):
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.n_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.n_bytes = 0
+
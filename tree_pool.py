@@ -0,0 +1,354 @@
+"""
+UCT search over a fixed-capacity node pool stored in parallel arrays.
+
+PooledUCTThinker plays the same search as uct.UCTKingDominoThinker and has the same choose_move/advance interface,
+but its tree lives in a NodePool: one slot per node in preallocated arrays (about 25 bytes a node, see
+NodePool.bytes_per_node), children in one contiguous block per node, no per-node Python objects or dicts. Memory is
+fixed when the thinker is made.
+
+When an expansion does not fit, the pool is collected: the subtrees below the least visited expanded nodes are
+dropped until at most half the pool is in use (those nodes keep their statistics and are expanded again if search
+comes back to them), and the surviving blocks slide down to the front of the arrays. advance() compacts the pool
+around the kept subtree the same way, without dropping anything.
+
+    thinker = PooledUCTThinker(board, dominos, think_time=3600, capacity=20 * 10 ** 6)   # about 500 MB
+    mv = thinker.choose_move(domino)
+    print(thinker.report())
+"""
+from array import array
+import math
+import random
+import time
+
+from kingDomino import random_playout
+
+CHANCE = -1  # tag of a chance node; a decision node is tagged with the number of the domino it places
+FREE_CHOICE = 0  # tag of a decision node placing any remaining domino
+DISCARD = -1  # edge of the move discarding a domino that fits nowhere
+
+
+class PoolFull(Exception):
+    pass
+
+
+class NodePool(object):
+    """ Parallel arrays with one slot per node:
+
+        visits, value   playouts through the node and their total score
+        first, count    the node's children, slots first .. first + count - 1; first is -1 until it is expanded
+        edge            what led to the node: a move code, DISCARD, or the number of the domino drawn
+        tag             CHANCE, FREE_CHOICE or the domino number of a decision node
+
+    Slots are handed out from the front (allocate) and reclaimed only by reset and collect."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.visits = array('I', [0]) * capacity
+        self.value = array('d', [0.0]) * capacity
+        self.first = array('i', [-1]) * capacity
+        self.count = array('I', [0]) * capacity
+        self.edge = array('i', [0]) * capacity
+        self.tag = array('b', [0]) * capacity
+        self.arrays = (self.visits, self.value, self.first, self.count, self.edge, self.tag)
+        self.used = 0
+        self.collections = 0
+        self.evicted = 0  # nodes dropped by collect
+
+    def __len__(self):
+        return self.used
+
+    @property
+    def bytes_per_node(self):
+        return sum(a.itemsize for a in self.arrays)
+
+    def memory_bytes(self):
+        """ Bytes held by the arrays, used or not."""
+        return self.capacity * self.bytes_per_node
+
+    def reset(self):
+        self.used = 0
+
+    def allocate(self, edges, tag):
+        """ Slots for new unexpanded nodes, one per edge, all tagged tag; returns the first. Raises PoolFull."""
+        n = len(edges)
+        start = self.used
+        if start + n > self.capacity:
+            raise PoolFull()
+        end = start + n
+        self.visits[start:end] = array('I', [0]) * n
+        self.value[start:end] = array('d', [0.0]) * n
+        self.first[start:end] = array('i', [-1]) * n
+        self.count[start:end] = array('I', [0]) * n
+        self.edge[start:end] = array('i', edges)
+        self.tag[start:end] = array('b', [tag]) * n
+        self.used = end
+        return start
+
+    def expand(self, node, edges, tag):
+        self.first[node] = self.allocate(edges, tag)
+        self.count[node] = len(edges)
+
+    def _live(self, root, threshold):
+        """ (blocks, nodes) kept under root when the children of nodes with fewer than threshold visits are dropped.
+        Root's children are always kept."""
+        blocks = [(root, 1)]
+        stack = [root]
+        nodes = 1
+        while stack:
+            node = stack.pop()
+            n = self.count[node]
+            if n and self.first[node] >= 0 and (node == root or self.visits[node] >= threshold):
+                first = self.first[node]
+                blocks.append((first, n))
+                nodes += n
+                stack.extend(range(first, first + n))
+        return blocks, nodes
+
+    def collect(self, root, target=None):
+        """ Keep at most target nodes (by default half the capacity) of root's tree, dropping the subtrees below the
+        least visited nodes first, and move them to the front of the pool. Everything not under root is freed.
+        Returns root's new index."""
+        if target is None:
+            target = self.capacity // 2
+        thresholds = sorted({self.visits[node] + 1 for node in range(self.used) if self.count[node]})
+        threshold = 0
+        blocks, nodes = self._live(root, threshold)
+        if nodes > target:
+            lo, hi = 0, len(thresholds) - 1  # smallest threshold keeping at most target nodes, or the largest
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._live(root, thresholds[mid])[1] <= target:
+                    hi = mid
+                else:
+                    lo = mid + 1
+            threshold = thresholds[lo] if thresholds else 0
+            before = nodes
+            blocks, nodes = self._live(root, threshold)
+            self.evicted += before - nodes
+            kept = {start for start, n in blocks}
+            for start, n in blocks:
+                for node in range(start, start + n):
+                    if self.count[node] and self.first[node] not in kept:
+                        self.first[node] = -1  # a leaf again, with its statistics
+                        self.count[node] = 0
+
+        moved = {}
+        position = 0
+        for start, n in sorted(blocks):
+            if start != position:
+                for a in self.arrays:
+                    a[position:position + n] = a[start:start + n]
+            moved[start] = position
+            position += n
+        for node in range(position):
+            if self.count[node]:
+                self.first[node] = moved[self.first[node]]
+        self.used = position
+        self.collections += 1
+        return moved[root]
+
+
+class PooledUCTThinker(object):
+    """
+    Usage, per turn, as uct.UCTKingDominoThinker:
+        mv = thinker.choose_move(domino)   # domino=None in free-choice mode
+        thinker.advance(mv, domino)        # plays mv on thinker.board and keeps its subtree
+
+    choose_move returns None when the domino cannot be placed (it is discarded by advance).
+    """
+
+    def __init__(self, board, remaining_dominos, think_time=10, exploration=1.4, free_choice=False,
+                 rollout_policy=None, capacity=10 ** 6):
+        self.board = board
+        self.remaining = set(remaining_dominos)
+        self.dominos_by_number = {d.number: d for d in remaining_dominos}
+        self.think_time = think_time  # seconds per move
+        self.exploration = exploration
+        self.free_choice = free_choice
+        self.rollout_policy = rollout_policy  # see rollout.py; None places uniformly at random
+        self.score_scale = 1.0  # largest playout score seen, scales the exploration term
+        self.pool = NodePool(capacity)
+        self.root = None  # index of the root node in self.pool
+        self.playouts = 0
+
+    def choose_move(self, domino=None, think_time=None, n_iterations=None):
+        """ Search from the current position until think_time runs out (or n_iterations are done) and return the most
+        visited move."""
+        if think_time is None:
+            think_time = self.think_time
+        if domino is not None:
+            self.dominos_by_number[domino.number] = domino
+        self.remaining.discard(domino)
+        self.root = self._root_for(domino)
+
+        pool = self.pool
+        now = time.time()
+        k = 0
+        while (n_iterations is None and time.time() - now < think_time) or (n_iterations is not None and
+                                                                              k < n_iterations):
+            try:
+                self._visit_decision(self.root)
+            except PoolFull:
+                used = pool.used
+                self.root = pool.collect(self.root)
+                assert pool.used < used, 'The node pool is too small to hold the root and its children.'
+                continue
+            k += 1
+            if pool.first[self.root] >= 0 and pool.count[self.root] <= 1:
+                break  # nothing to decide
+        return self._best_move(self.root)
+
+    def advance(self, move, domino=None):
+        """ Play move (None discards domino) on self.board and make the matching subtree the new root."""
+        pool = self.pool
+        root = self._root_for(domino)
+        child = self._child(root, DISCARD if move is None else self.board.rules.encode_move(move))
+        if move is not None:
+            assert self.board.assign_domino(move), 'Invalid move.'
+            domino = move.domino
+        self.remaining.discard(domino)
+        if child is None:
+            pool.reset()
+            self.root = None
+        else:
+            self.root = pool.collect(child, pool.capacity)
+
+    def root_moves(self):
+        """ Moves searched at the root so far."""
+        pool = self.pool
+        if self.root is None or pool.first[self.root] < 0:
+            return []
+        first = pool.first[self.root]
+        return [self._move(pool.edge[i]) for i in range(first, first + pool.count[self.root])]
+
+    def root_value(self, mv):
+        """ Mean playout score after mv at the root."""
+        child = self._child(self.root, DISCARD if mv is None else self.board.rules.encode_move(mv))
+        return self.pool.value[child] / self.pool.visits[child]
+
+    def memory(self):
+        pool = self.pool
+        return {'capacity': pool.capacity, 'nodes': pool.used, 'bytes': pool.memory_bytes(),
+                'collections': pool.collections, 'evicted': pool.evicted}
+
+    def report(self):
+        m = self.memory()
+        return '%d of %d nodes in use (%.1f MB), %d collections, %d nodes evicted, %d playouts' % (
+            m['nodes'], m['capacity'], m['bytes'] / 2.0 ** 20, m['collections'], m['evicted'], self.playouts)
+
+    def _root_for(self, domino):
+        """ The kept subtree for the position where domino has been drawn, or a fresh root."""
+        pool = self.pool
+        root = self.root
+        if root is not None and pool.tag[root] == CHANCE:
+            root = None if domino is None else self._child(root, domino.number)
+        tag = FREE_CHOICE if domino is None else domino.number
+        if root is None or pool.tag[root] != tag:
+            pool.reset()
+            root = pool.allocate([DISCARD], tag)
+        return root
+
+    def _child(self, node, edge):
+        pool = self.pool
+        if node is None or pool.first[node] < 0 or not pool.count[node]:
+            return None
+        first = pool.first[node]
+        try:
+            return pool.edge.index(edge, first, first + pool.count[node])
+        except ValueError:
+            return None
+
+    def _move(self, code):
+        if code == DISCARD:
+            return None
+        return self.board.rules.decode_move(code, self.dominos_by_number)
+
+    def _best_move(self, node):
+        """ Most visited move at node, or None if nothing has been searched."""
+        pool = self.pool
+        if pool.first[node] < 0 or not pool.count[node]:
+            return None
+        first = pool.first[node]
+        best = max(range(first, first + pool.count[node]), key=lambda i: (pool.visits[i], pool.value[i]))
+        return self._move(pool.edge[best]) if pool.visits[best] else None
+
+    def _expand_decision(self, node):
+        pool = self.pool
+        tag = pool.tag[node]
+        if tag == FREE_CHOICE:
+            codes = []
+            for domino in sorted(self.remaining, key=lambda d: d.number):
+                codes.extend(self.board.feasible_codes(domino))
+        else:
+            codes = self.board.feasible_codes(self.dominos_by_number[tag]) or [DISCARD]
+        pool.expand(node, codes, FREE_CHOICE if self.free_choice else CHANCE)
+
+    def _credit(self, node, score):
+        self.pool.visits[node] += 1
+        self.pool.value[node] += score
+        return score
+
+    def _playout(self):
+        self.playouts += 1
+        score = random_playout(self.board, self.remaining, self.rollout_policy)
+        self.score_scale = max(self.score_scale, score)
+        return score
+
+    def _ucb(self, first, count, visits):
+        pool = self.pool
+        log_n = math.log(visits)
+        c = self.exploration * self.score_scale
+        return max(range(first, first + count),
+                   key=lambda i: pool.value[i] / pool.visits[i] + c * math.sqrt(log_n / pool.visits[i]))
+
+    def _visit_decision(self, node):
+        """ One selection/expansion/rollout pass below node. Board and remaining set are restored on return."""
+        pool = self.pool
+        if pool.first[node] < 0:
+            self._expand_decision(node)
+        count = pool.count[node]
+        if not count:
+            return self._credit(node, self._playout())  # free choice with nothing left to place: the game is over
+
+        first = pool.first[node]
+        untried = [i for i in range(first, first + count) if not pool.visits[i]]
+        child = random.choice(untried) if untried else self._ucb(first, count, pool.visits[node])
+        mv = self._move(pool.edge[child])
+
+        placed = mv is not None
+        if placed:
+            self.board.push(mv)
+        # In free-choice mode the played domino leaves the deck here; otherwise it left when it was drawn.
+        removed = mv.domino if (placed and self.free_choice and mv.domino in self.remaining) else None
+        if removed is not None:
+            self.remaining.remove(removed)
+        try:
+            if untried:
+                score = self._credit(child, self._playout())
+            elif self.free_choice:
+                score = self._visit_decision(child)
+            else:
+                score = self._visit_chance(child)
+        finally:
+            if removed is not None:
+                self.remaining.add(removed)
+            if placed:
+                self.board.pop()
+        return self._credit(node, score)
+
+    def _visit_chance(self, node):
+        pool = self.pool
+        if not self.remaining or self.board.is_full():
+            return self._credit(node, self.board.final_score())
+        if pool.first[node] < 0:
+            pool.expand(node, sorted(d.number for d in self.remaining), 0)
+            first = pool.first[node]
+            pool.tag[first:first + pool.count[node]] = array('b', pool.edge[first:first + pool.count[node]])
+        domino = random.choice(tuple(self.remaining))
+        child = self._child(node, domino.number)
+        self.remaining.remove(domino)
+        try:
+            score = self._visit_decision(child)
+        finally:
+            self.remaining.add(domino)
+        return self._credit(node, score)
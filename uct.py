@@ -0,0 +1,180 @@
+"""
+UCT Monte Carlo tree search for solitaire KingDomino.
+
+Decision nodes choose a placement for a known domino (or, in free-choice mode, any placement of any remaining domino,
+which is how mcts_simple.py plays). Chance nodes draw the next domino uniformly from the remaining set. Leaves are
+finished with random_playout, and the subtree under the move actually played is kept for the next turn.
+"""
+import math
+import random
+import time
+
+from kingDomino import random_playout
+
+
+def same_domino(d1, d2):
+    """ Domino equality that also accepts None (free choice)."""
+    if d1 is None or d2 is None:
+        return d1 is d2
+    return d1 == d2
+
+
+class DecisionNode(object):
+
+    def __init__(self, domino=None):
+        self.domino = domino  # None: free choice among all remaining dominoes
+        self.moves = None  # filled in on the first visit
+        self.untried = None
+        self.children = {}  # move -> node reached by playing it
+        self.N = {}  # move -> visits
+        self.W = {}  # move -> total playout score
+        self.visits = 0
+
+    def best_move(self):
+        """ Most visited move, or None if nothing has been searched."""
+        if not self.N:
+            return None
+        return max(self.N, key=lambda mv: (self.N[mv], self.W[mv]))
+
+    def value(self, mv):
+        return self.W[mv] / self.N[mv]
+
+
+class ChanceNode(object):
+
+    def __init__(self):
+        self.children = {}  # domino -> DecisionNode
+        self.visits = 0
+
+
+class UCTKingDominoThinker(object):
+    """
+    Usage, per turn:
+        mv = thinker.choose_move(domino)   # domino=None in free-choice mode
+        thinker.advance(mv, domino)        # plays mv on thinker.board and keeps its subtree
+
+    choose_move returns None when the domino cannot be placed (it is discarded by advance).
+    """
+
+    def __init__(self, board, remaining_dominos, think_time=10, exploration=1.4, free_choice=False,
+                 rollout_policy=None):
+        self.board = board
+        self.remaining = set(remaining_dominos)
+        self.think_time = think_time  # seconds per move
+        self.exploration = exploration
+        self.free_choice = free_choice
+        self.rollout_policy = rollout_policy  # see rollout.py; None places uniformly at random
+        self.score_scale = 1.0  # largest playout score seen, scales the exploration term
+        self.root = None
+        self.playouts = 0
+
+    def choose_move(self, domino=None, think_time=None, n_iterations=None):
+        """ Search from the current position until think_time runs out (or n_iterations are done) and return the most
+        visited move."""
+        if think_time is None:
+            think_time = self.think_time
+        self.remaining.discard(domino)
+        self.root = self._root_for(domino)
+
+        now = time.time()
+        k = 0
+        while (n_iterations is None and time.time() - now < think_time) or (n_iterations is not None and
+                                                                              k < n_iterations):
+            self._visit_decision(self.root)
+            k += 1
+            if len(self.root.moves) <= 1:
+                break  # nothing to decide
+        return self.root.best_move()
+
+    def advance(self, move, domino=None):
+        """ Play move (None discards domino) on self.board and make the matching subtree the new root."""
+        root = self._root_for(domino)
+        child = root.children.get(move)
+        if move is not None:
+            assert self.board.assign_domino(move), 'Invalid move.'
+            domino = move.domino
+        self.remaining.discard(domino)
+        self.root = child
+
+    def _root_for(self, domino):
+        """ The kept subtree for the position where domino has been drawn, or a fresh node."""
+        root = self.root
+        if isinstance(root, ChanceNode):
+            root = root.children.get(domino)
+        if root is None or not same_domino(root.domino, domino):
+            root = DecisionNode(domino)
+        return root
+
+    def _candidate_moves(self, node):
+        if node.domino is not None:
+            moves = list(self.board.get_feasible_move_set(node.domino))
+            return moves if moves else [None]  # no placement: the domino is discarded
+        moves = {}  # Moves compare by sides, so dominoes with the same sides share theirs: one path per position
+        for domino in sorted(self.remaining, key=lambda d: d.number):
+            moves.update(dict.fromkeys(self.board.get_feasible_move_set(domino)))
+        return list(moves)
+
+    def _ucb_move(self, node):
+        log_n = math.log(node.visits)
+        c = self.exploration * self.score_scale
+        return max(node.N, key=lambda mv: node.W[mv] / node.N[mv] + c * math.sqrt(log_n / node.N[mv]))
+
+    def _playout(self):
+        self.playouts += 1
+        score = random_playout(self.board, self.remaining, self.rollout_policy)
+        self.score_scale = max(self.score_scale, score)
+        return score
+
+    def _visit_decision(self, node):
+        """ One selection/expansion/rollout pass below node. Board and remaining set are restored on return."""
+        if node.moves is None:
+            node.moves = self._candidate_moves(node)
+            node.untried = random.sample(node.moves, len(node.moves))
+        if not node.moves:
+            return self._playout()  # free choice with nothing left to place: the game is over
+
+        expand = len(node.untried) > 0
+        mv = node.untried.pop() if expand else self._ucb_move(node)
+
+        placed = mv is not None
+        if placed:
+            self.board.push(mv)
+        # In free-choice mode the played domino leaves the deck here; otherwise it left when it was drawn.
+        removed = mv.domino if (placed and self.free_choice and mv.domino in self.remaining) else None
+        if removed is not None:
+            self.remaining.remove(removed)
+        try:
+            child = node.children.get(mv)
+            if child is None:
+                child = node.children[mv] = DecisionNode() if self.free_choice else ChanceNode()
+            if expand:
+                score = self._playout()
+            elif self.free_choice:
+                score = self._visit_decision(child)
+            else:
+                score = self._visit_chance(child)
+        finally:
+            if removed is not None:
+                self.remaining.add(removed)
+            if placed:
+                self.board.pop()
+
+        node.visits += 1
+        node.N[mv] = node.N.get(mv, 0) + 1
+        node.W[mv] = node.W.get(mv, 0) + score
+        return score
+
+    def _visit_chance(self, node):
+        if not self.remaining or self.board.is_full():
+            return self.board.final_score()
+        domino = random.choice(tuple(self.remaining))
+        child = node.children.get(domino)
+        if child is None:
+            child = node.children[domino] = DecisionNode(domino)
+        self.remaining.remove(domino)
+        try:
+            score = self._visit_decision(child)
+        finally:
+            self.remaining.add(domino)
+        node.visits += 1
+        return score
@@ -0,0 +1,95 @@
+"""
+Long-lived playout workers. The pool is started once per game; each worker keeps the domino library resident, and
+tasks carry only an encoded board, a move code, a bitmask of remaining domino numbers and the board's rules (which
+pickle as their three parameters, see kingDomino.Rules). Workers return
+(move code, score sum, sum of squared scores, playout count, worker pid, start time, seconds spent).
+
+With start_method='forkserver' the server process imports PRELOAD once and each worker is forked from it, so workers
+start with the engine already imported even where 'fork' is unavailable or unsafe.
+"""
+from multiprocessing import get_context
+from os import cpu_count, getpid
+import time
+
+from kingDomino import STANDARD, decode_board, domino_mask, random_playout
+
+PRELOAD = ('kingDomino', 'domino_library', 'worker_pool')
+
+_DOMINOS_BY_NUMBER = {}
+
+
+def _init_worker():
+    from domino_library import DOMINO_LIB
+    _DOMINOS_BY_NUMBER.update({d.number: d for d in DOMINO_LIB})
+
+
+def dominos_from_mask(mask):
+    """ Dominoes whose numbers are set in mask, in number order."""
+    return [d for n, d in sorted(_DOMINOS_BY_NUMBER.items()) if (mask >> n) & 1]
+
+
+def evaluate_move(task):
+    """ Worker task: random playouts after one move for think_time seconds (at least one playout)."""
+    board_code, move_code, remaining_mask, think_time, batch_size, policy, rules = task
+    board = decode_board(board_code, rules)
+    mv = rules.decode_move(move_code, _DOMINOS_BY_NUMBER)
+    dominos = dominos_from_mask(remaining_mask & ~(1 << mv.domino.number))
+    assert board.push(mv), 'Invalid move sent to worker.'
+
+    total = 0
+    total_sq = 0
+    k = 0
+    now = time.time()
+    while k == 0 or time.time() - now < think_time:
+        if batch_size:
+            from batch_playout import playout_scores
+            scores = playout_scores(board, dominos, batch_size).astype('int64')
+            total += int(scores.sum())
+            total_sq += int((scores * scores).sum())
+            k += batch_size
+        else:
+            score = random_playout(board, dominos, policy)
+            total += score
+            total_sq += score * score
+            k += 1
+    return move_code, total, total_sq, k, getpid(), now, time.time() - now
+
+
+class PlayoutPool(object):
+    """ Worker processes for MonteCarloKingDominoThinker. Use as a context manager or call close()."""
+
+    def __init__(self, n_processes=None, start_method=None, preload=PRELOAD):
+        self.n_processes = n_processes or cpu_count()
+        context = get_context(start_method)  # None: the platform default
+        if start_method == 'forkserver':
+            context.set_forkserver_preload(list(preload))
+        self.pool = context.Pool(self.n_processes, initializer=_init_worker)
+        self.last_dispatch = None  # time the last evaluate() sent its tasks
+        self.last_results = []  # every worker result of the last evaluate(), as returned by evaluate_move
+
+    def evaluate(self, board, moves, remaining_dominos, think_time, batch_size=None, policy=None):
+        """ {move code: (score sum, playout count)} for each of moves, given think_time seconds per move. policy is
+        the rollout policy for random_playout."""
+        board_code = board.encode()
+        remaining_mask = domino_mask(remaining_dominos)
+        tasks = [(board_code, code, remaining_mask, think_time, batch_size, policy, board.rules) for code in moves]
+        self.last_dispatch = time.time()
+        self.last_results = list(self.pool.imap_unordered(evaluate_move, tasks))
+        return {result[0]: (result[1], result[3]) for result in self.last_results}
+
+    def submit(self, board_code, move_code, remaining_mask, think_time, batch_size=None, policy=None, rules=STANDARD,
+               callback=None):
+        """ Start one evaluate_move task without waiting for it. callback is called from the pool's result thread
+        with the task's result, or with the exception it raised. rules are those board_code was encoded under."""
+        task = (board_code, move_code, remaining_mask, think_time, batch_size, policy, rules)
+        return self.pool.apply_async(evaluate_move, (task,), callback=callback, error_callback=callback)
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()